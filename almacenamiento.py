@@ -0,0 +1,262 @@
+import heapq
+import marshal
+import mmap
+import os
+import struct
+import weakref
+from bisect import bisect_left
+from collections import OrderedDict
+
+from arbol_b import NodoB
+
+MAGICO = b'ARBOLB01'
+# Cabecera en la página 0: mágico, tamaño de página, páginas usadas, página y longitud de los metadatos
+CABECERA = struct.Struct('<8sIQQQ')
+# Prefijo de cada página con la longitud del nodo serializado
+LONGITUD = struct.Struct('<I')
+# Páginas que se agregan al archivo como mínimo cada vez que hay que agrandarlo
+PAGINAS_POR_CRECIMIENTO = 256
+# Bytes por entrada que puede sumar marshal al reemplazar un texto corto repetido por una referencia a él
+MARGEN_REFERENCIAS = 12
+
+
+class AlmacenamientoPaginado:
+    """Guarda los nodos de los árboles B como páginas de tamaño fijo en un solo archivo mapeado en memoria"""
+
+    def __init__(self, ruta, tamano_pagina=8192, paginas_en_cache=1024):
+        existe = os.path.exists(ruta) and os.path.getsize(ruta) > 0
+        self.ruta = ruta
+        self.archivo = open(ruta, 'r+b' if existe else 'w+b')
+        self.paginas_en_cache = paginas_en_cache
+        self.cache = OrderedDict()  # página -> NodoB, de la menos a la más recientemente usada
+        self.aciertos = self.fallos = 0  # Lecturas servidas desde la caché y desde el mapa
+
+        if existe:
+            self.mapa = mmap.mmap(self.archivo.fileno(), 0)
+            (magico, self.tamano_pagina, self.paginas_usadas,
+             self.pagina_metadatos, self.longitud_metadatos) = CABECERA.unpack_from(self.mapa, 0)
+            if magico != MAGICO:
+                raise ValueError(f"{ruta} no es un archivo de árbol B")
+            inicio = self.pagina_metadatos * self.tamano_pagina
+            self.metadatos = marshal.loads(self.mapa[inicio:inicio + self.longitud_metadatos]) \
+                if self.longitud_metadatos else {}
+        else:
+            self.tamano_pagina = tamano_pagina
+            self.paginas_usadas = 1  # La página 0 es la cabecera
+            self.pagina_metadatos = self.longitud_metadatos = 0
+            self.metadatos = {}
+            self.archivo.truncate(tamano_pagina * PAGINAS_POR_CRECIMIENTO)
+            self.mapa = mmap.mmap(self.archivo.fileno(), 0)
+            self._escribir_cabecera()
+
+        # Páginas liberadas disponibles para reutilizar, en un montículo: se reutilizan primero las más bajas
+        # para que las del final del archivo queden libres y se puedan recortar
+        self.libres = self.metadatos.pop('libres', [])
+        heapq.heapify(self.libres)
+        # Copia en escritura: una página liberada se recicla solo cuando ya no la leen la versión durable
+        # (hasta el siguiente sincronizar) ni las instantáneas vivas publicadas entre su reserva y su liberación
+        self.epoca = 1  # Se incrementa con cada instantánea publicada y con cada sincronizar
+        self.epoca_durable = 0  # Las páginas reservadas hasta esta época pueden ser parte de la versión durable
+        self.creacion = {}  # página -> época en que se reservó; las que ya estaban en el archivo cuentan como 0
+        self.lectores = weakref.WeakKeyDictionary()  # instantánea viva -> época en que se publicó
+        self.diferidas = []  # (creación, liberación, página) liberadas desde el último sincronizar
+        # Época de la instantánea viva más antigua que puede leerlas -> [(creación, liberación, página)]
+        self.retenidas = {}
+
+    def _escribir_cabecera(self):
+        """Escribe la cabecera que apunta a los metadatos vigentes"""
+        CABECERA.pack_into(self.mapa, 0, MAGICO, self.tamano_pagina, self.paginas_usadas,
+                           self.pagina_metadatos, self.longitud_metadatos)
+
+    def _paginas_para(self, longitud):
+        """Cantidad de páginas consecutivas que ocupan 'longitud' bytes"""
+        return -(-longitud // self.tamano_pagina)
+
+    def _asegurar_capacidad(self, paginas):
+        """Agranda el archivo (y vuelve a mapearlo) para que quepan 'paginas' páginas"""
+        actuales = len(self.mapa) // self.tamano_pagina
+        if paginas <= actuales:
+            return
+        nuevas = max(paginas, actuales + PAGINAS_POR_CRECIMIENTO, actuales * 2)
+        self.archivo.truncate(nuevas * self.tamano_pagina)
+        # El mapa anterior no se cierra: un lector concurrente puede estar usándolo y se libera al soltarlo
+        self.mapa = mmap.mmap(self.archivo.fileno(), 0)
+
+    def reservar(self):
+        """Reserva una página para un nodo nuevo, reutilizando las liberadas"""
+        if not self.libres:
+            self._reciclar()
+        if self.libres:
+            pagina = heapq.heappop(self.libres)
+        else:
+            pagina = self.paginas_usadas
+            self.paginas_usadas += 1
+            self._asegurar_capacidad(self.paginas_usadas)
+        self.creacion[pagina] = self.epoca
+        return pagina
+
+    def liberar(self, pagina):
+        """Marca una página como libre; se reutiliza cuando nadie puede leerla (ver _retener)"""
+        self.cache.pop(pagina, None)
+        liberada = (self.creacion.pop(pagina, 0), self.epoca, pagina)
+        if liberada[0] <= self.epoca_durable:
+            self.diferidas.append(liberada)
+        else:
+            # Reservada después del último sincronizar: solo pueden leerla las instantáneas
+            self._retener([liberada], sorted(self.lectores.values()))
+
+    def registrar_instantanea(self, instantanea):
+        """Registra una instantánea publicada: las páginas que ya tenía y se liberen después no se reciclan mientras viva"""
+        self.lectores[instantanea] = self.epoca
+        self.epoca += 1
+
+    def _retener(self, liberadas, vivas):
+        """Deja cada página a cargo de la instantánea viva más antigua que puede leerla, o la pasa a libres si no hay"""
+        for creacion, liberacion, pagina in liberadas:
+            # Una instantánea lee la página si se publicó desde que se reservó y antes de que se liberara
+            i = bisect_left(vivas, creacion)
+            if i < len(vivas) and vivas[i] < liberacion:
+                self.retenidas.setdefault(vivas[i], []).append((creacion, liberacion, pagina))
+            else:
+                heapq.heappush(self.libres, pagina)
+
+    def _reciclar(self):
+        """Vuelve a repartir solo las páginas retenidas por instantáneas que ya no viven"""
+        vivas = sorted(self.lectores.values())
+        for epoca in self.retenidas.keys() - set(vivas):
+            self._retener(self.retenidas.pop(epoca), vivas)
+
+    def _recordar(self, pagina, nodo):
+        """Guarda el nodo en la caché LRU, descartando el menos usado si se supera la capacidad"""
+        self.cache[pagina] = nodo
+        self.cache.move_to_end(pagina)
+        if len(self.cache) > self.paginas_en_cache:
+            self.cache.popitem(last=False)
+
+    def maximo_entrada(self, grado):
+        """Bytes que puede ocupar cada clave con su registro para que un nodo lleno del grado dado siempre quepa"""
+        # Fijo en un nodo lleno: cabeceras, total, 2t hijos y 2t conteos (enteros de 5 bytes)
+        fijos = LONGITUD.size + len(marshal.dumps((False, 0, [], [], [0] * 2 * grado, [0] * 2 * grado)))
+        return (self.tamano_pagina - fijos) // (2 * grado - 1) - MARGEN_REFERENCIAS
+
+    @staticmethod
+    def tamano_entrada(clave, registro):
+        """Bytes que ocupan una clave y su registro dentro de la página de un nodo"""
+        return len(marshal.dumps(clave)) + len(marshal.dumps(registro))
+
+    def _carga(self, pagina):
+        """Tupla serializada de la página, sin armar el nodo"""
+        inicio = pagina * self.tamano_pagina
+        (longitud,) = LONGITUD.unpack_from(self.mapa, inicio)
+        inicio += LONGITUD.size
+        return marshal.loads(self.mapa[inicio:inicio + longitud])
+
+    def leer(self, pagina):
+        """Obtiene el nodo de una página: de la caché o deserializándolo desde el mapa en memoria"""
+        nodo = self.cache.get(pagina)
+        if nodo is not None:
+            self.aciertos += 1
+            try:
+                self.cache.move_to_end(pagina)
+            except KeyError:
+                pass  # Otro hilo la sacó de la caché entre ambas operaciones
+            return nodo
+
+        self.fallos += 1
+        es_hoja, total, claves, datos, hijos, *conteos = self._carga(pagina)
+
+        nodo = NodoB(es_hoja=es_hoja)
+        nodo.total = total
+        nodo.claves = claves
+        nodo.datos = datos
+        nodo.hijos = hijos
+        nodo.pagina = pagina
+        if not es_hoja:
+            # Los archivos guardados antes de los conteos por hijo los calculan leyendo los hijos una vez
+            nodo.conteos = conteos[0] if conteos else [self._carga(hijo)[1] for hijo in hijos]
+        self._recordar(pagina, nodo)
+        return nodo
+
+    def escribir(self, nodo):
+        """Serializa el nodo en su página (escritura inmediata) y lo deja en la caché"""
+        carga = marshal.dumps((nodo.es_hoja, nodo.total, nodo.claves, nodo.datos, nodo.hijos, nodo.conteos))
+        if LONGITUD.size + len(carga) > self.tamano_pagina:
+            raise ValueError(f"El nodo ocupa {len(carga)} bytes y no cabe en una página de "
+                             f"{self.tamano_pagina}; aumente tamano_pagina o reduzca el grado")
+
+        inicio = nodo.pagina * self.tamano_pagina
+        LONGITUD.pack_into(self.mapa, inicio, len(carga))
+        inicio += LONGITUD.size
+        self.mapa[inicio:inicio + len(carga)] = carga
+        self._recordar(nodo.pagina, nodo)
+
+    def _tomar_consecutivas(self, cantidad):
+        """Saca de las libres 'cantidad' páginas consecutivas y devuelve la primera, o None si no hay"""
+        self.libres.sort()  # Una lista ordenada sigue siendo un montículo válido
+        for i in range(len(self.libres) - cantidad + 1):
+            if self.libres[i + cantidad - 1] - self.libres[i] == cantidad - 1:
+                inicio = self.libres[i]
+                del self.libres[i:i + cantidad]
+                return inicio
+        return None
+
+    def _recortar_final(self):
+        """Devuelve al archivo las páginas libres del final en lugar de guardarlas en la lista de libres"""
+        self.libres.sort()
+        while self.libres and self.libres[-1] == self.paginas_usadas - 1:
+            self.libres.pop()
+            self.paginas_usadas -= 1
+
+    def _achicar_archivo(self):
+        """Acorta el archivo si le sobra mucho más espacio del que crecería de una vez (ver _asegurar_capacidad)"""
+        actuales = len(self.mapa) // self.tamano_pagina
+        nuevas = max(2 * self.paginas_usadas, PAGINAS_POR_CRECIMIENTO)
+        if actuales <= 2 * nuevas:
+            return
+        # Nadie lee las páginas que se cortan: están libres, fuera de la versión durable y de las instantáneas
+        self.mapa = mmap.mmap(self.archivo.fileno(), nuevas * self.tamano_pagina)
+        self.archivo.truncate(nuevas * self.tamano_pagina)
+
+    def sincronizar(self, metadatos):
+        """Guarda los metadatos en páginas libres (o al final), apunta la cabecera a ellas y baja todo a disco"""
+        # Los metadatos vigentes son parte de la versión durable: se liberan después de cambiar la cabecera
+        anteriores = range(self.pagina_metadatos, self.pagina_metadatos + self._paginas_para(self.longitud_metadatos))
+        self._recortar_final()
+
+        # Al reabrir no hay instantáneas: todo lo que no referencia la nueva versión durable queda libre
+        pendientes = [pagina for *_, pagina in self.diferidas] + list(anteriores)
+        pendientes += [pagina for retenidas in self.retenidas.values() for *_, pagina in retenidas]
+        carga = marshal.dumps(dict(metadatos, libres=self.libres + pendientes))
+        cantidad = self._paginas_para(len(carga))
+        inicio = self._tomar_consecutivas(cantidad)
+        if inicio is None:
+            inicio = self.paginas_usadas
+            self.paginas_usadas += cantidad
+            self._asegurar_capacidad(self.paginas_usadas)
+        else:
+            # Sin las páginas que acaba de tomar la lista es más corta: sigue cabiendo en 'cantidad' páginas
+            carga = marshal.dumps(dict(metadatos, libres=self.libres + pendientes))
+        self.mapa[inicio * self.tamano_pagina:inicio * self.tamano_pagina + len(carga)] = carga
+
+        # Primero los datos y luego la cabecera, para que nunca apunte a metadatos incompletos
+        self.mapa.flush()
+        self.pagina_metadatos, self.longitud_metadatos = inicio, len(carga)
+        self.metadatos = metadatos
+        self._escribir_cabecera()
+        self.mapa.flush()
+
+        # Lo liberado hasta aquí ya no es parte de la versión durable
+        for pagina in anteriores:
+            heapq.heappush(self.libres, pagina)
+        self.epoca_durable = self.epoca
+        self.epoca += 1
+        self._retener(self.diferidas, sorted(self.lectores.values()))
+        self.diferidas = []
+        self._reciclar()
+        self._achicar_archivo()
+
+    def cerrar(self):
+        """Baja los cambios a disco y cierra el archivo"""
+        self.mapa.flush()
+        self.mapa.close()
+        self.archivo.close()
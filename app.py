@@ -1,16 +1,250 @@
 # Importaciones necesarias para el funcionamiento de la aplicación Flask
 from flask import Flask, render_template, request, \
     jsonify  # Flask: framework web, render_template: renderizar HTML, request: manejar peticiones HTTP, jsonify: convertir datos a JSON
-import time  # Para medir tiempos de ejecución de búsquedas - si se elimina, no se podrán medir los tiempos de respuesta
-from arbol_b import ArbolB  # Importa la clase del árbol B personalizado - CRÍTICO: sin esto la app no funciona
+from flask import stream_with_context  # Para enviar listados grandes por partes mientras se recorre el árbol
+from flask import g  # Para guardar el inicio de cada petición hasta que termina de enviarse
+import atexit  # Para bajar a disco el árbol paginado al terminar el proceso
+import hashlib  # Para calcular el ETag de las respuestas a partir de su contenido
+import json  # Para leer cuerpos NDJSON línea por línea en la carga masiva
+from functools import wraps  # Para que el decorador de caché conserve el nombre de cada vista
+from itertools import islice  # Para tomar solo una página del recorrido perezoso del árbol sin materializarlo completo
+import os  # Para leer la configuración desde variables de entorno
+import uuid  # Para distinguir este proceso en los ETag de las respuestas en flujo
+import time  # Para medir tiempos de ejecución con perf_counter (monótono) - si se elimina, no se podrán medir los tiempos de respuesta
+from arbol_b import ArbolB, ClaveDuplicada, ORDENES, RegistroDemasiadoGrande  # Importa la clase del árbol B personalizado - CRÍTICO: sin esto la app no funciona
+from almacenamiento import AlmacenamientoPaginado  # Almacenamiento en disco por páginas para que los datos sobrevivan a reinicios
+from cache_respuestas import CacheRespuestas  # Respuestas ya serializadas por versión del árbol - evita recalcular en cada sondeo
+from metricas import MuestreoPerfiles, RegistroMetricas  # Histogramas de latencia por endpoint y perfiles por muestreo
+from particionado import ArbolParticionado  # Árboles repartidos en procesos para usar todos los núcleos en recorridos y estadísticas
+from persistencia import GestorPersistencia  # WAL y puntos de control para recuperarse rápido y sin perder escrituras
 from proveedor import Proveedor  # Importa la clase Proveedor - CRÍTICO: sin esto no se pueden crear objetos proveedor
 
 # Crear la instancia de la aplicación Flask
 app = Flask(__name__)  # Crea la aplicación web - CRÍTICO: sin esto no hay servidor web
 
-# Inicializar el árbol B vacío con grado 3
-arbol_servicios = ArbolB(
-    grado=3)  # Estructura de datos principal que almacena todos los proveedores - CRÍTICO: sin esto no hay almacenamiento de datos
+# Tamaño de página por defecto y máximo para el listado paginado de proveedores
+LIMITE_PAGINA = 50  # Proveedores por página si el cliente no indica 'limit'
+LIMITE_MAXIMO_PAGINA = 1000  # Tope por página - sin esto un cliente podría pedir todo el árbol de una vez
+LIMITE_BUSQUEDA_NOMBRE = 10  # Sugerencias por búsqueda de nombre si el cliente no indica 'limit'
+CAMPOS_EDITABLES = ('nombre', 'servicio', 'calificacion', 'ubicacion')  # Campos que acepta PATCH; el ID es la clave del árbol
+
+# Carga masiva de proveedores
+TIPOS_NDJSON = ('application/x-ndjson', 'application/ndjson')  # Tipos de contenido aceptados como NDJSON (un proveedor por línea)
+MAXIMO_ERRORES_LOTE = 100  # Errores de validación que se devuelven como máximo - sin esto un lote inválido daría una respuesta enorme
+
+# Respuestas en flujo para listados y búsquedas
+FORMATOS_FLUJO = ('json', 'ndjson')  # Valores aceptados en ?format=: arreglo JSON por partes o un proveedor por línea
+TAMANO_BLOQUE_FLUJO = 500  # Proveedores serializados por cada parte enviada - sin esto habría una parte por proveedor
+INSTANCIA = uuid.uuid4().hex  # Identifica este proceso: un ETag por versión del árbol no vale después de reiniciar
+
+# Métricas
+FORMATOS_METRICAS = ('json', 'prometheus', 'perfil')  # Valores aceptados en ?format= de /api/metricas
+TIPO_PROMETHEUS = 'text/plain; version=0.0.4; charset=utf-8'  # Tipo de contenido del formato de texto de Prometheus
+
+# Configuración del almacenamiento: sin ARBOL_ARCHIVO el árbol vive solo en memoria y se pierde al reiniciar
+app.config.from_mapping(
+    ARBOL_GRADO=int(os.environ.get('ARBOL_GRADO', 32)),  # Grado mínimo t: nodos de t-1 a 2t-1 claves; más grande = árbol más bajo
+    ARBOL_ARCHIVO=os.environ.get('ARBOL_ARCHIVO'),  # Ruta del archivo de páginas del árbol
+    ARBOL_TAMANO_PAGINA=int(os.environ.get('ARBOL_TAMANO_PAGINA', 16384)),  # Bytes por página (solo al crear el archivo)
+    ARBOL_PAGINAS_CACHE=int(os.environ.get('ARBOL_PAGINAS_CACHE', 1024)),  # Páginas en caché: acota la memoria al conjunto de trabajo
+    ARBOL_PARTICIONES=int(os.environ.get('ARBOL_PARTICIONES', 1)),  # Procesos con una parte de los proveedores cada uno; 1 = un solo árbol
+    # WAL e instantáneas: sin ARBOL_DIRECTORIO las escrituras no pasan por el registro
+    ARBOL_DIRECTORIO=os.environ.get('ARBOL_DIRECTORIO'),  # Carpeta del WAL y de las instantáneas
+    WAL_FSYNC=os.environ.get('WAL_FSYNC', 'lote'),  # 'siempre' (más durable), 'lote' (fsync agrupado por intervalo) o 'nunca' (más rápido)
+    WAL_INTERVALO_FSYNC_MS=float(os.environ.get('WAL_INTERVALO_FSYNC_MS', 10)),  # Máximo entre fsync con la política 'lote'
+    CHECKPOINT_INTERVALO=int(os.environ.get('CHECKPOINT_INTERVALO', 10000)),  # Escrituras entre puntos de control
+    # Caché de respuestas de lectura: 0 entradas la desactiva
+    CACHE_RESPUESTAS=int(os.environ.get('CACHE_RESPUESTAS', 256)),  # Respuestas guardadas como máximo
+    CACHE_RESPUESTAS_MB=float(os.environ.get('CACHE_RESPUESTAS_MB', 64)),  # Megabytes de respuestas como máximo
+    # Perfiles con cProfile: fracción de las peticiones que se perfilan; 0 (por defecto) no perfila ninguna
+    PERFIL_MUESTREO=float(os.environ.get('PERFIL_MUESTREO', 0))
+)
+
+
+def crear_arbol():
+    """Crea el árbol de proveedores: paginado en disco si se configuró ARBOL_ARCHIVO, particionado o en memoria si no"""
+    if app.config['ARBOL_PARTICIONES'] > 1:
+        if app.config['ARBOL_ARCHIVO']:  # Cada proceso tendría que abrir su propio archivo de páginas
+            raise ValueError('ARBOL_ARCHIVO no admite ARBOL_PARTICIONES; use ARBOL_DIRECTORIO para la durabilidad')
+        arbol = ArbolParticionado(app.config['ARBOL_PARTICIONES'], grado=app.config['ARBOL_GRADO'])
+        atexit.register(arbol.cerrar)  # Detiene los procesos de las particiones al terminar
+        return arbol
+    if not app.config['ARBOL_ARCHIVO']:
+        return ArbolB(grado=app.config['ARBOL_GRADO'])
+
+    almacenamiento = AlmacenamientoPaginado(app.config['ARBOL_ARCHIVO'],
+                                            tamano_pagina=app.config['ARBOL_TAMANO_PAGINA'],
+                                            paginas_en_cache=app.config['ARBOL_PAGINAS_CACHE'])
+    arbol = ArbolB(grado=app.config['ARBOL_GRADO'], almacenamiento=almacenamiento)  # Abre el árbol guardado leyendo solo la raíz
+    atexit.register(almacenamiento.cerrar)  # Baja los cambios a disco al terminar - sin esto podrían quedar páginas sin escribir
+    return arbol
+
+
+def crear_persistencia(arbol):
+    """Recupera el árbol desde la última instantánea y la cola del WAL si se configuró ARBOL_DIRECTORIO"""
+    if not app.config['ARBOL_DIRECTORIO']:
+        return None
+
+    persistencia = GestorPersistencia(arbol, app.config['ARBOL_DIRECTORIO'],
+                                      politica_fsync=app.config['WAL_FSYNC'],
+                                      intervalo_fsync=app.config['WAL_INTERVALO_FSYNC_MS'] / 1000,
+                                      intervalo_checkpoint=app.config['CHECKPOINT_INTERVALO'])
+    atexit.register(persistencia.cerrar)  # Punto de control final al terminar - sin esto el siguiente arranque reaplica todo el WAL
+    return persistencia
+
+
+# Inicializar el árbol B con el grado configurado
+# Las peticiones leen desde arbol_servicios.instantanea(): una versión inmutable, sin cerrojo y sin esperar a los escritores
+arbol_servicios = crear_arbol()  # Estructura de datos principal que almacena todos los proveedores - CRÍTICO: sin esto no hay almacenamiento de datos
+persistencia = crear_persistencia(arbol_servicios)  # Registro de escrituras del árbol, o None si no se configuró
+cache_respuestas = CacheRespuestas(app.config['CACHE_RESPUESTAS'],
+                                   int(app.config['CACHE_RESPUESTAS_MB'] * 1024 * 1024))  # LRU de respuestas serializadas
+registro_metricas = RegistroMetricas()  # Latencias de todas las peticiones por endpoint
+muestreo_perfiles = MuestreoPerfiles(app.config['PERFIL_MUESTREO'])  # Perfiles acumulados de las peticiones sorteadas
+
+
+@app.before_request
+def iniciar_medicion():
+    """Marca el inicio de la petición y, si sale sorteada, empieza a perfilarla"""
+    g.inicio = time.perf_counter()
+    g.perfil = muestreo_perfiles.iniciar()  # None si el muestreo está desactivado o no le tocó
+
+
+@app.after_request
+def marcar_flujo(respuesta):
+    """Marca las respuestas en flujo: su contexto se cierra dos veces, al devolverlas y al terminar de enviarlas"""
+    g.en_flujo = respuesta.is_streamed
+    return respuesta
+
+
+@app.teardown_request
+def registrar_medicion(error=None):
+    """Registra la latencia al terminar la petición; en flujo, después de enviar la última parte"""
+    if g.pop('en_flujo', False):  # Primer cierre de una respuesta en flujo: todavía no se envió nada
+        return
+    inicio = g.pop('inicio', None)
+    if inicio is None:  # Ya registrada, o la petición falló antes de before_request
+        return
+    endpoint = request.url_rule.rule if request.url_rule else 'sin_ruta'  # Plantilla de la ruta: acota las series por endpoint
+    registro_metricas.registrar(endpoint, time.perf_counter() - inicio)
+    perfil = g.pop('perfil', None)
+    if perfil is not None:
+        muestreo_perfiles.terminar(perfil)
+
+
+def respuesta_en_cache(vista):
+    """Sirve la vista desde la caché mientras el árbol no cambie y responde 304 si el cliente ya tiene la versión"""
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        # La clave incluye la versión del árbol: una escritura invalida todo sin recorrer la caché
+        clave = (request.path, request.query_string, arbol_servicios.instantanea().modificaciones)
+        entrada = cache_respuestas.obtener(clave)
+        if entrada is None:
+            respuesta = app.make_response(vista(*args, **kwargs))
+            if respuesta.status_code != 200:  # Solo se guardan respuestas exitosas
+                return respuesta
+            if respuesta.is_streamed:
+                # Listado en flujo: no se guarda el cuerpo; el ETag sale de la versión del árbol en este proceso
+                respuesta.set_etag(hashlib.sha1(repr((INSTANCIA,) + clave).encode()).hexdigest())
+                return respuesta.make_conditional(request)  # El generador aún no corrió: un 304 no recorre el árbol
+            cuerpo = respuesta.get_data()
+            # ETag fuerte por contenido: coincide entre reinicios y entre procesos con los mismos datos
+            entrada = (cuerpo, respuesta.mimetype, hashlib.sha1(cuerpo).hexdigest())
+            cache_respuestas.guardar(clave, *entrada)
+
+        cuerpo, tipo, etag = entrada
+        respuesta = app.response_class(cuerpo, mimetype=tipo)
+        respuesta.set_etag(etag)
+        return respuesta.make_conditional(request)  # 304 sin cuerpo si If-None-Match coincide
+    return envoltura
+
+
+def guardar_proveedor(clave, datos):
+    """Inserta un proveedor de forma durable: por el WAL si está configurado, si no directo en el árbol"""
+    if persistencia:
+        persistencia.insertar(clave, datos)
+    else:
+        arbol_servicios.insertar(clave, datos)
+        arbol_servicios.sincronizar()  # Hace durable el cambio si el árbol es paginado
+
+
+def guardar_lote(registros):
+    """Carga un lote de proveedores de forma durable con una sola entrada en el WAL"""
+    if persistencia:
+        persistencia.cargar_masivo(registros)
+    else:
+        arbol_servicios.cargar_masivo(registros)  # Construcción de abajo hacia arriba en lugar de inserciones sueltas
+        arbol_servicios.sincronizar()
+
+
+def borrar_proveedor(clave):
+    """Elimina un proveedor de forma durable; devuelve sus datos o None si no existía"""
+    if persistencia:
+        return persistencia.eliminar(clave)
+    datos = arbol_servicios.eliminar(clave)  # Rebalanceo con préstamos y fusiones en una sola bajada
+    arbol_servicios.sincronizar()
+    return datos
+
+
+def modificar_proveedor(clave, cambios):
+    """Cambia campos de un proveedor de forma durable; devuelve los datos nuevos o None si no existía"""
+    if persistencia:
+        return persistencia.actualizar(clave, cambios)
+    datos = arbol_servicios.actualizar(clave, cambios)  # En su lugar: copia solo el camino hasta el proveedor
+    arbol_servicios.sincronizar()
+    return datos
+
+
+def a_json(valor):
+    """Serializa igual que jsonify (claves ordenadas, sin espacios) para armar respuestas por partes"""
+    return app.json.dumps(valor, separators=(',', ':'))
+
+
+def en_bloques(proveedores):
+    """Agrupa el iterador de proveedores en listas de TAMANO_BLOQUE_FLUJO"""
+    while True:
+        bloque = list(islice(proveedores, TAMANO_BLOQUE_FLUJO))
+        if not bloque:
+            return
+        yield bloque
+
+
+def flujo_arreglo_json(proveedores):
+    """Arreglo JSON enviado por partes: '[', los proveedores separados por comas y ']'"""
+    yield '['
+    separador = ''
+    for bloque in en_bloques(proveedores):
+        yield separador + ','.join(a_json(proveedor) for proveedor in bloque)
+        separador = ','
+    yield ']'
+
+
+def flujo_ndjson(proveedores):
+    """Un proveedor JSON por línea, enviado por partes"""
+    for bloque in en_bloques(proveedores):
+        yield ''.join(a_json(proveedor) + '\n' for proveedor in bloque)
+
+
+def flujo_resultados(proveedores, resumen):
+    """Objeto {'resultados': [...], ...} por partes; los demás campos se calculan al terminar el arreglo"""
+    yield '{"resultados":'
+    yield from flujo_arreglo_json(proveedores)
+    yield ',' + a_json(resumen())[1:]  # Los campos del resumen sin la llave inicial: continúan el mismo objeto
+
+
+def respuesta_en_flujo(proveedores, resumen=None, total=None):
+    """Envía los proveedores a medida que se recorre el árbol: NDJSON con ?format=ndjson, si no JSON por partes"""
+    formato = request.args.get('format', 'json')
+    if formato not in FORMATOS_FLUJO:
+        return jsonify({'error': f'El parámetro format debe ser uno de: {", ".join(FORMATOS_FLUJO)}'}), 400
+
+    if formato == 'ndjson':
+        respuesta = app.response_class(stream_with_context(flujo_ndjson(proveedores)), mimetype='application/x-ndjson')
+        if total is not None:
+            respuesta.headers['X-Total-Encontrados'] = str(total)  # En NDJSON no hay objeto para el total
+        return respuesta
+    cuerpo = flujo_arreglo_json(proveedores) if resumen is None else flujo_resultados(proveedores, resumen)
+    return app.response_class(stream_with_context(cuerpo), mimetype='application/json')
 
 
 @app.route('/')  # Decorador que define la ruta raíz del sitio web - sin esto no se puede acceder a la página principal
@@ -22,14 +256,66 @@ def index():
 
 @app.route('/api/proveedores',
            methods=['GET'])  # Define endpoint GET para obtener proveedores - sin esto no se pueden consultar los datos
+@respuesta_en_cache  # Sondeos repetidos sin escrituras de por medio: una búsqueda en la caché, sin recorrer ni serializar
 def obtener_proveedores():
-    """Obtiene todos los proveedores ordenados según el parámetro especificado"""
+    """Obtiene todos los proveedores ordenados, o una página si se indica 'limit', 'offset' o 'after_id'"""
+    if any(param in request.args for param in ('limit', 'offset', 'after_id')):  # Paginación por cursor - sin esto siempre se serializa todo el árbol
+        return obtener_pagina_proveedores()
+
     orden = request.args.get('orden',
                              'nombre')  # Obtiene el parámetro 'orden' de la URL, por defecto 'nombre' - sin esto siempre ordenaría por nombre
-    proveedores = arbol_servicios.obtener_todos_ordenados(
-        orden)  # Llama al método del árbol para obtener datos ordenados - CRÍTICO: sin esto no hay datos de respuesta
-    return jsonify(
-        proveedores)  # Convierte la lista de proveedores a formato JSON para la respuesta HTTP - sin esto el frontend no puede procesar los datos
+    proveedores = arbol_servicios.instantanea().iterar_ordenados(
+        orden)  # Recorrido perezoso sobre una instantánea: la exportación ve una sola versión aunque haya escrituras
+    return respuesta_en_flujo(
+        proveedores)  # Se envía a medida que se recorre - sin esto se arma la lista y el JSON completos en memoria
+
+
+def obtener_pagina_proveedores():
+    """Devuelve una página de proveedores: por cursor de ID ('after_id') o por posición en un orden ('orden' + 'offset')"""
+    limite = request.args.get('limit', LIMITE_PAGINA, type=int)  # Tamaño de página - sin esto no hay límite por respuesta
+    if limite is None or not 1 <= limite <= LIMITE_MAXIMO_PAGINA:  # Validación del tamaño - sin esto se podría pedir todo el árbol
+        return jsonify({'error': f'El parámetro limit debe estar entre 1 y {LIMITE_MAXIMO_PAGINA}'}), 400
+
+    orden = request.args.get('orden')  # Campo de orden opcional - sin él se pagina por ID
+    if orden is not None:
+        return obtener_pagina_ordenada(orden, limite)
+    if 'offset' in request.args:  # La posición solo aplica a los órdenes - sin esto se ignoraría y se repetiría la primera página
+        return jsonify({'error': 'El parámetro offset solo aplica a los listados con orden; use after_id'}), 400
+
+    despues_de = request.args.get('after_id', type=int)  # Cursor: último ID recibido en la página anterior
+    if 'after_id' in request.args and despues_de is None:  # El cursor debe ser un ID entero
+        return jsonify({'error': 'El parámetro after_id debe ser un entero'}), 400
+
+    desde = None if despues_de is None else despues_de + 1  # El cursor es exclusivo - sin esto se repetiría el último proveedor
+    pagina = [datos for _, datos in islice(arbol_servicios.instantanea().rango(desde=desde), limite)]  # Recorrido perezoso: solo se visitan los nodos de la página
+
+    return jsonify({
+        'proveedores': pagina,  # Proveedores de esta página
+        'siguiente': pagina[-1]['id'] if len(pagina) == limite else None  # Cursor para la siguiente página, None si no hay más
+    })
+
+
+def obtener_pagina_ordenada(orden, limite):
+    """Devuelve la página 'offset' del listado ordenado por nombre, calificación o ubicación sin reordenar"""
+    if orden not in ORDENES:  # Solo los campos con índice ordenado - sin esto se aceptarían órdenes inexistentes
+        return jsonify({'error': f'El parámetro orden debe ser uno de: {", ".join(ORDENES)}'}), 400
+    if 'after_id' in request.args:  # El cursor por ID no aplica a otros órdenes
+        return jsonify({'error': 'El parámetro after_id solo aplica al listado por ID; use offset'}), 400
+    desplazamiento = request.args.get('offset', 0, type=int)  # Posición inicial dentro del orden
+    if desplazamiento is None or desplazamiento < 0:  # Validación de la posición
+        return jsonify({'error': 'El parámetro offset debe ser un entero no negativo'}), 400
+
+    arbol = arbol_servicios.instantanea()  # Una sola versión para la página y el total - sin esto podrían no coincidir
+    pagina = arbol.obtener_pagina_ordenada(orden, desplazamiento,
+                                           limite)  # Consulta de rango O(log n) sobre el índice ordenado
+    total = len(arbol)  # Conteo mantenido en la raíz - sin esto habría que recorrer el árbol
+    siguiente = desplazamiento + len(pagina)  # Posición de la siguiente página
+
+    return jsonify({
+        'proveedores': pagina,  # Proveedores de esta página
+        'total': total,  # Total de proveedores para calcular el número de páginas
+        'siguiente_offset': siguiente if siguiente < total else None  # Offset de la siguiente página, None si no hay más
+    })
 
 
 @app.route('/api/proveedores', methods=[
@@ -39,28 +325,16 @@ def agregar_proveedor():
     try:  # Manejo de errores - sin esto cualquier error crashearía la aplicación
         datos = request.json  # Obtiene los datos JSON del cuerpo de la petición HTTP - CRÍTICO: sin esto no hay datos para procesar
 
-        # Validar que todos los campos requeridos estén presentes
-        campos_requeridos = ['id', 'nombre', 'servicio', 'calificacion',
-                             'ubicacion']  # Lista de campos obligatorios - sin esto no hay validación de integridad
-        if not all(key in datos for key in
-                   campos_requeridos):  # Verifica que todos los campos existan - sin esto se podrían insertar datos incompletos
-            return jsonify({
-                               'error': 'Faltan campos requeridos'}), 400  # Respuesta de error HTTP 400 - sin esto el cliente no sabría qué está mal
+        # Validar campos requeridos, calificación y ubicación
+        error = validar_proveedor(datos)  # Reglas compartidas con la carga masiva - sin esto habría datos inválidos
+        if error:
+            return jsonify({'error': error}), 400  # Respuesta de error HTTP 400 - sin esto el cliente no sabría qué está mal
 
         # Verificar que el ID no exista ya en el sistema
-        if arbol_servicios.buscar(datos['id']):  # Busca si el ID ya existe - sin esto habría IDs duplicados
+        # Rechazo rápido sobre la instantánea; el árbol lo vuelve a verificar dentro de su cerrojo al insertar
+        if arbol_servicios.instantanea().buscar(datos['id']):  # Busca si el ID ya existe - sin esto habría IDs duplicados
             return jsonify({'error': 'El ID ya existe'}), 400  # Error de conflicto - sin esto se sobreescribirían datos
 
-        # Validar que la calificación esté en el rango válido (1-5)
-        if not 1 <= datos['calificacion'] <= 5:  # Validación de rango - sin esto podrían haber calificaciones inválidas
-            return jsonify({
-                               'error': 'La calificación debe estar entre 1 y 5'}), 400  # Error de validación - sin esto datos inconsistentes
-
-        # Validar que la ubicación no esté vacía
-        if not datos['ubicacion'].strip():  # Verifica que la ubicación tenga contenido - sin esto ubicaciones vacías
-            return jsonify(
-                {'error': 'La ubicación es requerida'}), 400  # Error de validación - sin esto datos incompletos
-
         # Crear objeto Proveedor con los datos validados
         proveedor = Proveedor(  # Instancia un nuevo objeto proveedor - CRÍTICO: sin esto no hay objeto para almacenar
             datos['id'],  # ID único del proveedor
@@ -71,41 +345,182 @@ def agregar_proveedor():
         )
 
         # Insertar el proveedor en el árbol B
-        arbol_servicios.insertar(datos['id'],
-                                 proveedor.to_dict())  # Almacena en la estructura de datos - CRÍTICO: sin esto no se persisten los datos
+        guardar_proveedor(datos['id'],
+                          proveedor.to_dict())  # Almacena en la estructura de datos - CRÍTICO: sin esto no se persisten los datos
 
         return jsonify({
                            'mensaje': 'Proveedor agregado exitosamente'}), 201  # Respuesta de éxito HTTP 201 - sin esto el cliente no sabría si fue exitoso
 
+    except ClaveDuplicada:  # Otra petición insertó el mismo ID después de la verificación anterior
+        return jsonify({'error': 'El ID ya existe'}), 400
+    except RegistroDemasiadoGrande as e:  # Textos que no caben en una página - sin esto serían un error 500
+        return jsonify({'error': str(e)}), 400
     except Exception as e:  # Captura cualquier error no previsto - sin esto errores inesperados crashearían la app
         return jsonify({'error': str(e)}), 500  # Error interno del servidor - sin esto no habría feedback de errores
 
 
+def validar_proveedor(datos):
+    """Valida los datos de un proveedor; devuelve el mensaje de error o None si son válidos"""
+    if not isinstance(datos, dict):  # Cada proveedor debe ser un objeto JSON
+        return 'Cada proveedor debe ser un objeto JSON'
+
+    # Validar que todos los campos requeridos estén presentes
+    campos_requeridos = ['id', 'nombre', 'servicio', 'calificacion',
+                         'ubicacion']  # Lista de campos obligatorios - sin esto no hay validación de integridad
+    if not all(key in datos for key in
+               campos_requeridos):  # Verifica que todos los campos existan - sin esto se podrían insertar datos incompletos
+        return 'Faltan campos requeridos'
+
+    # Validar que el ID sea entero: es la clave del árbol y debe poder compararse con las demás
+    if not isinstance(datos['id'], int) or isinstance(datos['id'], bool):
+        return 'El ID debe ser un entero'
+
+    # Validar que el nombre y el servicio sean textos no vacíos: alimentan los índices y los contadores
+    if not isinstance(datos['nombre'], str) or not datos['nombre'].strip():
+        return 'El nombre es requerido'
+    if not isinstance(datos['servicio'], str) or not datos['servicio'].strip():
+        return 'El servicio es requerido'
+
+    # Validar que la calificación esté en el rango válido (1-5)
+    if not isinstance(datos['calificacion'], (int, float)) or isinstance(datos['calificacion'], bool) or not 1 <= datos[
+        'calificacion'] <= 5:  # Validación de rango - sin esto podrían haber calificaciones inválidas
+        return 'La calificación debe estar entre 1 y 5'
+
+    # Validar que la ubicación no esté vacía
+    if not isinstance(datos['ubicacion'], str) or not datos[
+        'ubicacion'].strip():  # Verifica que la ubicación tenga contenido - sin esto ubicaciones vacías
+        return 'La ubicación es requerida'
+
+    return None
+
+
+def leer_ndjson(flujo):
+    """Genera los objetos de un cuerpo NDJSON línea por línea sin cargar el cuerpo completo"""
+    for linea in flujo:
+        if linea.strip():  # Se ignoran las líneas vacías
+            try:
+                yield json.loads(linea)
+            except ValueError:
+                yield None  # Línea inválida: validar_proveedor la reporta con su posición
+
+
+@app.route('/api/proveedores/bulk',
+           methods=['POST'])  # Endpoint de carga masiva - sin esto cada proveedor requiere su propia petición HTTP
+def agregar_proveedores_masivo():
+    """Agrega un lote de proveedores (arreglo JSON o NDJSON), validándolo completo en una sola pasada antes de cargarlo"""
+    try:
+        if request.mimetype in TIPOS_NDJSON:  # Flujo NDJSON: se procesa línea por línea
+            lote = leer_ndjson(request.stream)
+        else:  # Arreglo JSON con todos los proveedores
+            lote = request.get_json(silent=True)
+            if not isinstance(lote, list):
+                return jsonify({'error': 'Se esperaba un arreglo JSON o un flujo NDJSON de proveedores'}), 400
+
+        registros = []  # Pares (id, datos) válidos para la carga en bloque
+        ids_lote = set()  # IDs ya vistos en el lote - sin esto se aceptarían duplicados dentro del mismo lote
+        errores = []  # Errores de validación con la posición del proveedor en el lote
+        for indice, datos in enumerate(lote):
+            error = validar_proveedor(datos)
+            if error is None and (datos['id'] in ids_lote or arbol_servicios.instantanea().buscar(datos['id']) is not None):
+                error = 'El ID ya existe'  # Duplicado dentro del lote o contra el árbol
+            if error:
+                errores.append({'indice': indice, 'error': error})
+                continue
+            ids_lote.add(datos['id'])
+            registros.append((datos['id'], Proveedor.from_dict(datos).to_dict()))  # Solo los campos del proveedor
+
+        if errores:  # El lote se acepta completo o no se acepta - sin esto quedarían cargas parciales
+            return jsonify({
+                'error': 'El lote contiene proveedores inválidos',
+                'errores': errores[:MAXIMO_ERRORES_LOTE],
+                'total_errores': len(errores)
+            }), 400
+
+        guardar_lote(registros)  # Carga en bloque, pasando por el WAL si está configurado
+        return jsonify({
+            'mensaje': 'Proveedores agregados exitosamente',
+            'total_agregados': len(registros)
+        }), 201
+
+    except (ClaveDuplicada, RegistroDemasiadoGrande) as e:  # El árbol lo rechaza antes de cargar nada
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:  # Captura cualquier error no previsto
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/proveedores/<int:id_proveedor>',
+           methods=['DELETE'])  # Baja de un proveedor - sin esto quitar uno obligaba a reconstruir el árbol
+def eliminar_proveedor(id_proveedor):
+    """Elimina un proveedor y lo quita de los índices y contadores"""
+    datos = borrar_proveedor(id_proveedor)  # Pasa por el WAL si está configurado
+    if datos is None:
+        return jsonify({'error': 'Proveedor no encontrado'}), 404
+    return jsonify({'mensaje': 'Proveedor eliminado exitosamente', 'proveedor': datos})
+
+
+@app.route('/api/proveedores/<int:id_proveedor>',
+           methods=['PATCH'])  # Cambio de campos (p. ej. la calificación) sin eliminar y reinsertar al proveedor
+def actualizar_proveedor(id_proveedor):
+    """Actualiza los campos enviados de un proveedor, validando el resultado con las mismas reglas que al crearlo"""
+    cambios = request.get_json(silent=True)  # Solo los campos a cambiar
+    if not isinstance(cambios, dict) or not cambios:
+        return jsonify({'error': 'El cuerpo debe ser un objeto JSON con los campos a cambiar'}), 400
+    if cambios.get('id', id_proveedor) != id_proveedor:  # El ID ubica al proveedor en el árbol
+        return jsonify({'error': 'El ID no se puede cambiar'}), 400
+    cambios.pop('id', None)
+    desconocidos = sorted(set(cambios) - set(CAMPOS_EDITABLES))
+    if desconocidos:  # Sin esto un campo mal escrito se ignoraría en silencio
+        return jsonify({'error': f'Campos no editables: {", ".join(desconocidos)}'}), 400
+
+    actual = arbol_servicios.instantanea().buscar(id_proveedor)
+    if actual is None:
+        return jsonify({'error': 'Proveedor no encontrado'}), 404
+    error = validar_proveedor(dict(actual, **cambios))  # Mismas reglas que al agregar, sobre el resultado final
+    if error:
+        return jsonify({'error': error}), 400
+
+    try:
+        datos = modificar_proveedor(id_proveedor, cambios)  # Actualiza solo los índices y contadores de los campos cambiados
+    except RegistroDemasiadoGrande as e:  # El nuevo registro no cabe en una página
+        return jsonify({'error': str(e)}), 400
+    if datos is None:  # Eliminado por otra petición entre la búsqueda y la escritura
+        return jsonify({'error': 'Proveedor no encontrado'}), 404
+    return jsonify({'mensaje': 'Proveedor actualizado exitosamente', 'proveedor': datos})
+
+
 @app.route(
     '/api/buscar/<tipo_servicio>')  # Endpoint dinámico para buscar por tipo de servicio - sin esto no hay búsqueda por servicio
 def buscar_por_servicio(tipo_servicio):
     """Busca todos los proveedores que ofrecen un tipo específico de servicio"""
-    inicio = time.time()  # Marca el tiempo de inicio - sin esto no hay medición de rendimiento
-    resultados = arbol_servicios.buscar_por_servicio(
-        tipo_servicio)  # Ejecuta la búsqueda en el árbol - CRÍTICO: sin esto no hay funcionalidad de búsqueda
-    tiempo_busqueda = time.time() - inicio  # Calcula el tiempo transcurrido - sin esto no hay métricas de rendimiento
-
-    return jsonify({  # Retorna respuesta estructurada en JSON
-        'resultados': resultados,  # Lista de proveedores encontrados - sin esto no hay datos de respuesta
-        'tiempo_busqueda': round(tiempo_busqueda * 1000, 2),
-        # Tiempo en milisegundos redondeado - sin esto no hay métricas
-        'total_encontrados': len(resultados)  # Contador de resultados - sin esto no hay información de cantidad
-    })
+    return buscar_en_flujo('servicio',
+                           tipo_servicio)  # Ejecuta la búsqueda en el árbol - CRÍTICO: sin esto no hay funcionalidad de búsqueda
+
+
+def buscar_en_flujo(campo, valor):
+    """Envía por partes los proveedores con el valor dado en un campo indexado, con tiempo y total al final"""
+    inicio = time.perf_counter()  # Marca el tiempo de inicio - sin esto no hay medición de rendimiento
+    arbol = arbol_servicios.instantanea()  # Una versión fija para todo el envío
+    total = arbol.contar_por(campo, valor)  # Conteo O(log n) en el índice - sin esto NDJSON no podría informar el total
+
+    def resumen():
+        """Campos que se envían después de los resultados"""
+        return {
+            'tiempo_busqueda': round((time.perf_counter() - inicio) * 1000, 2),  # Tiempo en milisegundos hasta terminar el envío
+            'total_encontrados': total  # Contador de resultados - sin esto no hay información de cantidad
+        }
+
+    return respuesta_en_flujo(arbol.iterar_por(campo, valor), resumen,
+                              total)  # Lista de proveedores encontrados, serializada a medida que se recorre el índice
 
 
 @app.route(
     '/api/buscar_id/<int:id_proveedor>')  # Endpoint para buscar por ID específico - sin esto no hay búsqueda por ID
 def buscar_por_id(id_proveedor):
     """Busca un proveedor específico por su ID único"""
-    inicio = time.time()  # Marca tiempo de inicio para métricas
-    resultado = arbol_servicios.buscar(
+    inicio = time.perf_counter()  # Marca tiempo de inicio para métricas
+    resultado = arbol_servicios.instantanea().buscar(
         id_proveedor)  # Busca directamente por clave en el árbol - CRÍTICO: funcionalidad principal
-    tiempo_busqueda = time.time() - inicio  # Calcula tiempo de ejecución
+    tiempo_busqueda = time.perf_counter() - inicio  # Calcula tiempo de ejecución
 
     if resultado:  # Si se encontró el proveedor - sin esta validación habría respuestas inconsistentes
         return jsonify({
@@ -125,73 +540,145 @@ def buscar_por_id(id_proveedor):
     '/api/buscar_ubicacion/<ubicacion>')  # Endpoint para buscar por ubicación - sin esto no hay filtrado geográfico
 def buscar_por_ubicacion(ubicacion):
     """Busca todos los proveedores en una ubicación geográfica específica"""
-    inicio = time.time()  # Tiempo de inicio para métricas
-    resultados = arbol_servicios.buscar_por_ubicacion(ubicacion)  # Búsqueda por ubicación en el árbol
-    tiempo_busqueda = time.time() - inicio  # Cálculo de tiempo transcurrido
+    return buscar_en_flujo('ubicacion', ubicacion)  # Búsqueda por ubicación en el árbol, enviada por partes
+
+
+@app.route('/api/consulta')  # Consulta combinada por varios criterios - sin esto el cliente filtra varias respuestas por su cuenta
+def consultar_proveedores():
+    """Filtra por servicio, ubicación, rango de calificación y rango de ID a la vez, con orden y límite"""
+    limite = request.args.get('limit', LIMITE_PAGINA, type=int)  # Máximo de resultados - sin esto la consulta no tiene cota
+    if limite is None or not 1 <= limite <= LIMITE_MAXIMO_PAGINA:
+        return jsonify({'error': f'El parámetro limit debe estar entre 1 y {LIMITE_MAXIMO_PAGINA}'}), 400
+    orden = request.args.get('orden', 'id')  # Orden del resultado: por ID o por un campo con índice
+    if orden != 'id' and orden not in ORDENES:
+        return jsonify({'error': f'El parámetro orden debe ser id o uno de: {", ".join(ORDENES)}'}), 400
+
+    criterios = {}
+    for nombre, tipo in (('calificacion_min', float), ('calificacion_max', float),
+                         ('id_desde', int), ('id_hasta', int)):  # Límites numéricos opcionales (incluidos)
+        if nombre in request.args:
+            criterios[nombre] = request.args.get(nombre, type=tipo)
+            if criterios[nombre] is None:  # El valor no es un número del tipo esperado
+                return jsonify({'error': f'El parámetro {nombre} debe ser numérico'}), 400
+    for nombre in ('servicio', 'ubicacion'):  # Filtros por igualdad sin distinguir mayúsculas
+        if request.args.get(nombre):
+            criterios[nombre] = request.args[nombre]
+
+    inicio = time.perf_counter()  # Tiempo de planificación y ejecución
+    arbol = arbol_servicios.instantanea()  # El plan y su ejecución ven la misma versión del árbol
+    plan = arbol.planificar(orden=orden, limite=limite, **criterios)  # Conteos O(log n) para elegir el camino más selectivo
+    resultados = arbol.ejecutar_plan(plan)  # Recorre solo el camino elegido y para al llegar al límite si el orden coincide
+    tiempo_busqueda = time.perf_counter() - inicio
 
     return jsonify({
-        'resultados': resultados,  # Lista de proveedores en la ubicación
-        'tiempo_busqueda': round(tiempo_busqueda * 1000, 2),  # Métricas de rendimiento
-        'total_encontrados': len(resultados)  # Contador de resultados
+        'resultados': resultados,  # Proveedores que cumplen todos los criterios
+        'total_encontrados': len(resultados),  # Cantidad devuelta (como mucho 'limit')
+        'plan': plan,  # Camino elegido y filas por camino: permite revisar por qué la consulta fue lenta
+        'tiempo_busqueda': round(tiempo_busqueda * 1000, 2)  # Tiempo en milisegundos
+    })
+
+
+@app.route('/api/buscar_nombre')  # Búsqueda por nombre para autocompletar - sin esto solo hay búsqueda por servicio o ubicación exactos
+@respuesta_en_cache  # Cacheada por versión del árbol y con ETag - sin esto cada tecla repite la búsqueda
+def buscar_por_nombre():
+    """Busca proveedores cuyo nombre contiene palabras que empiezan con las de 'q' o, si no alcanzan, parecidas"""
+    texto = request.args.get('q', '').strip()  # Texto escrito por el usuario - sin esto no hay qué buscar
+    if not texto:
+        return jsonify({'error': 'El parámetro q es obligatorio'}), 400
+    limite = request.args.get('limit', LIMITE_BUSQUEDA_NOMBRE, type=int)  # Máximo de resultados - sin esto la búsqueda no tiene cota
+    if limite is None or not 1 <= limite <= LIMITE_MAXIMO_PAGINA:
+        return jsonify({'error': f'El parámetro limit debe estar entre 1 y {LIMITE_MAXIMO_PAGINA}'}), 400
+    aproximada = request.args.get('difuso', 'true').lower() not in ('0', 'false', 'no')  # Tolerar errores de tipeo
+
+    inicio = time.perf_counter()  # Tiempo de búsqueda
+    resultados = arbol_servicios.instantanea().buscar_nombre(texto, limite, aproximada)  # Prefijos por índice de palabras y parecidas por trigramas
+    tiempo_busqueda = time.perf_counter() - inicio
+
+    return jsonify({
+        'resultados': resultados,  # Proveedores con su puntaje y tipo de coincidencia, del más al menos parecido
+        'total_encontrados': len(resultados),  # Cantidad devuelta (como mucho 'limit')
+        'tiempo_busqueda': round(tiempo_busqueda * 1000, 2)  # Tiempo en milisegundos
+    })
+
+
+@app.route('/api/metricas')  # Latencias por endpoint y contadores del árbol - sin esto no se ve dónde se va el tiempo
+def obtener_metricas():
+    """Devuelve latencias p50/p95/p99 por endpoint, contadores de los árboles B y de las cachés, en JSON o Prometheus"""
+    formato = request.args.get('format', 'json')
+    if formato not in FORMATOS_METRICAS:
+        return jsonify({'error': f'El parámetro format debe ser uno de: {", ".join(FORMATOS_METRICAS)}'}), 400
+    if formato == 'perfil':  # Funciones con más tiempo acumulado en las peticiones perfiladas
+        if muestreo_perfiles.fraccion <= 0:
+            return jsonify({'error': 'El muestreo de perfiles está desactivado; configure PERFIL_MUESTREO'}), 400
+        return app.response_class(muestreo_perfiles.reporte(), mimetype='text/plain')
+
+    arboles = arbol_servicios.obtener_uso()  # Nodos visitados, descensos y divisiones por árbol (principal e índices)
+    caches = {'respuestas': {'aciertos': cache_respuestas.aciertos, 'fallos': cache_respuestas.fallos}}
+    almacenamiento = arbol_servicios.almacenamiento
+    if almacenamiento:  # Árbol paginado: aciertos de la caché de páginas frente a lecturas del mapa
+        caches['paginas'] = {'aciertos': almacenamiento.aciertos, 'fallos': almacenamiento.fallos}
+
+    if formato == 'prometheus':
+        series = [
+            (f'arbol_{contador}_total', 'counter', ayuda,
+             [({'arbol': nombre}, uso[contador]) for nombre, uso in arboles.items()])
+            for contador, ayuda in (('nodos_visitados', 'Hijos leídos al bajar o recorrer'),
+                                    ('descensos', 'Bajadas desde la raíz con búsqueda binaria'),
+                                    ('comparaciones_estimadas', 'Comparaciones estimadas de las búsquedas binarias'),
+                                    ('divisiones', 'Nodos divididos al insertar'))
+        ] + [
+            (f'arbol_{medida}', 'gauge', ayuda, [({'arbol': nombre}, uso[medida]) for nombre, uso in arboles.items()])
+            for medida, ayuda in (('claves', 'Claves en el árbol'), ('total_nodos', 'Nodos del árbol'),
+                                  ('altura', 'Altura del árbol'))
+        ] + [
+            (f'cache_{resultado}_total', 'counter', f'Lecturas de caché con {resultado}',
+             [({'cache': nombre}, valores[resultado]) for nombre, valores in caches.items()])
+            for resultado in ('aciertos', 'fallos')
+        ]
+        return app.response_class(registro_metricas.prometheus(series), content_type=TIPO_PROMETHEUS)
+
+    return jsonify({
+        'endpoints': registro_metricas.resumen(),  # Cantidad y latencias en milisegundos por ruta
+        'arboles': arboles,  # Contadores y forma de cada árbol B
+        'caches': caches,  # Aciertos y fallos de las cachés
+        'perfiles_muestreados': muestreo_perfiles.muestras  # Peticiones perfiladas (ver ?format=perfil)
     })
 
 
 @app.route(
     '/api/estadisticas')  # Endpoint para obtener estadísticas del sistema - sin esto no hay información analítica
+@respuesta_en_cache  # Cacheada por versión del árbol y con ETag - sin esto cada sondeo recalcula y serializa
 def obtener_estadisticas():
     """Genera estadísticas completas del sistema incluyendo distribución de servicios y ubicaciones"""
-    stats = arbol_servicios.obtener_estadisticas()  # Obtiene estadísticas básicas del árbol - sin esto no hay métricas estructurales
+    arbol = arbol_servicios.instantanea()  # Versión publicada: estadísticas y distribuciones del mismo momento
+    stats = arbol.obtener_estadisticas()  # Estadísticas básicas mantenidas por el árbol en O(1) - sin esto no hay métricas estructurales
 
-    # Obtener todos los proveedores para análisis adicional
-    todos_proveedores = arbol_servicios.obtener_todos_ordenados()  # Lista completa de proveedores - CRÍTICO para análisis
-    servicios = {}  # Diccionario para contar servicios - sin esto no hay distribución por servicio
-    ubicaciones = {}  # Diccionario para contar ubicaciones - sin esto no hay distribución geográfica
-
-    # Procesar cada proveedor para generar estadísticas
-    for proveedor in todos_proveedores:  # Itera sobre todos los datos - sin esto no hay análisis completo
-        servicio = proveedor['servicio']  # Extrae el tipo de servicio
-        ubicacion = proveedor['ubicacion']  # Extrae la ubicación
-
-        # Contar ocurrencias de cada servicio
-        servicios[servicio] = servicios.get(servicio,
-                                            0) + 1  # Incrementa contador o inicializa en 1 - sin esto no hay conteo
-        # Contar ocurrencias de cada ubicación
-        ubicaciones[ubicacion] = ubicaciones.get(ubicacion, 0) + 1  # Incrementa contador o inicializa en 1
-
-    # Agregar estadísticas adicionales al objeto de respuesta
+    # Agregar las distribuciones que el árbol mantiene al insertar - sin recorrer a todos los proveedores
     stats[
-        'servicios_disponibles'] = servicios  # Distribución de tipos de servicios - sin esto no hay análisis por categoría
-    stats['ubicaciones_disponibles'] = ubicaciones  # Distribución geográfica - sin esto no hay análisis geográfico
+        'servicios_disponibles'] = arbol.obtener_distribucion('servicio')  # Distribución de tipos de servicios - sin esto no hay análisis por categoría
+    stats['ubicaciones_disponibles'] = arbol.obtener_distribucion('ubicacion')  # Distribución geográfica - sin esto no hay análisis geográfico
     return jsonify(stats)  # Retorna todas las estadísticas en formato JSON
 
 
 @app.route(
     '/api/servicios_unicos')  # Endpoint para obtener lista única de servicios - sin esto no hay opciones para filtros
+@respuesta_en_cache  # Cacheada por versión del árbol y con ETag - sin esto cada sondeo recalcula y serializa
 def obtener_servicios_unicos():
     """Obtiene la lista de todos los tipos de servicios únicos disponibles en el sistema"""
-    todos_proveedores = arbol_servicios.obtener_todos_ordenados()  # Obtiene todos los proveedores
-    servicios_unicos = set()  # Conjunto para eliminar duplicados automáticamente - sin esto habría servicios repetidos
-
-    # Extraer servicios únicos
-    for proveedor in todos_proveedores:  # Itera sobre cada proveedor
-        servicios_unicos.add(proveedor['servicio'])  # Agrega al conjunto (automáticamente elimina duplicados)
+    servicios_unicos = arbol_servicios.instantanea().obtener_distribucion('servicio')  # Los valores distintos ya están contados en el árbol - sin recorrerlo
 
     return jsonify(
-        sorted(list(servicios_unicos)))  # Convierte a lista ordenada y retorna en JSON - sin sorted() no habría orden
+        sorted(servicios_unicos))  # Lista ordenada de los servicios distintos en JSON - sin sorted() no habría orden
 
 
 @app.route(
     '/api/ubicaciones_unicas')  # Endpoint para obtener lista única de ubicaciones - sin esto no hay opciones geográficas
+@respuesta_en_cache  # Cacheada por versión del árbol y con ETag - sin esto cada sondeo recalcula y serializa
 def obtener_ubicaciones_unicas():
     """Obtiene la lista de todas las ubicaciones únicas disponibles en el sistema"""
-    todos_proveedores = arbol_servicios.obtener_todos_ordenados()  # Obtiene todos los proveedores
-    ubicaciones_unicas = set()  # Conjunto para eliminar duplicados automáticamente
-
-    # Extraer ubicaciones únicas
-    for proveedor in todos_proveedores:  # Itera sobre cada proveedor
-        ubicaciones_unicas.add(proveedor['ubicacion'])  # Agrega al conjunto
+    ubicaciones_unicas = arbol_servicios.instantanea().obtener_distribucion('ubicacion')  # Valores distintos mantenidos por el árbol
 
-    return jsonify(sorted(list(ubicaciones_unicas)))  # Lista ordenada en formato JSON
+    return jsonify(sorted(ubicaciones_unicas))  # Lista ordenada en formato JSON
 
 
 # Punto de entrada principal de la aplicación
@@ -1,191 +1,1294 @@
+import heapq
+import re
+import sys
+import threading
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from itertools import islice
+
+from proveedor import Proveedor
+
+# Campos por los que se puede obtener el listado ordenado de proveedores
+ORDENES = ('nombre', 'calificacion', 'ubicacion')
+
+# Un lote menor que len(árbol) // FACTOR_MEZCLA se inserta clave por clave en lugar de reconstruir
+FACTOR_MEZCLA = 16
+
+# Mayor que cualquier ID: cierra por arriba los rangos (valor, id) de los índices secundarios
+MAXIMO_ID = float('inf')
+
+# Campos con índice secundario que pueden filtrar una consulta combinada y cómo se filtran
+FILTROS_IGUALDAD = ('servicio', 'ubicacion')
+FILTROS_RANGO = ('calificacion',)
+# Una fila leída por un índice cuesta una búsqueda extra en el árbol principal
+COSTO_FILA_INDICE = 2
+
+# Mayor que cualquier palabra: cierra por arriba los rangos de prefijos del índice de nombres
+MAXIMO_TEXTO = '\U0010ffff'
+# Búsqueda aproximada por trigramas: similitud de Jaccard mínima y palabras parecidas que se consideran
+UMBRAL_SIMILITUD = 0.3
+MAXIMO_SIMILARES = 20
+SEPARADORES = re.compile(r'[\W_]+')
+
+
+def palabras(texto):
+    """Palabras de un texto para buscar: sin tildes, en minúsculas y sin signos"""
+    texto = unicodedata.normalize('NFKD', texto)
+    texto = ''.join(caracter for caracter in texto if not unicodedata.combining(caracter))
+    return [palabra for palabra in SEPARADORES.split(texto.lower()) if palabra]
+
+
+def clave_coincidencia(resultado):
+    """Orden de los resultados de buscar_nombre: primero por prefijo, luego aproximados; en cada grupo, por puntaje"""
+    return resultado['coincidencia'] != 'prefijo', -resultado['puntaje'], resultado['proveedor']['id']
+
+
+def trigramas(palabra):
+    """Conjunto de trigramas de una palabra, con un espacio a cada lado para que cuenten el inicio y el fin"""
+    palabra = f' {palabra} '
+    return {palabra[i:i + 3] for i in range(len(palabra) - 2)}
+
+
+class ClaveDuplicada(ValueError):
+    """La clave que se quiere insertar ya está en el árbol (o repetida en el lote)"""
+
+
+class RegistroDemasiadoGrande(ValueError):
+    """El registro (o una de sus entradas en los índices) no cabe en una página del almacenamiento"""
+
+
 class NodoB:
+    # Atributos fijos: sin __dict__ por nodo
+    __slots__ = ('claves', 'datos', 'hijos', 'conteos', 'es_hoja', 'total', 'pagina', 'version')
+
     def __init__(self, es_hoja=False):
         self.claves = []  # Lista de claves (IDs de proveedores)
         self.datos = []  # Lista de datos asociados a las claves
-        self.hijos = []  # Lista de hijos
+        self.hijos = () if es_hoja else []  # Lista de hijos (las hojas comparten una tupla vacía)
+        # Claves en el subárbol de cada hijo: el rango de una clave se calcula sin leer los hermanos
+        self.conteos = () if es_hoja else []
         self.es_hoja = es_hoja
+        self.total = 0  # Cantidad de claves en el subárbol (estadístico de orden)
+        self.pagina = None  # Número de página cuando el árbol vive en un almacenamiento paginado
+        self.version = 0  # Versión de escritura que creó el nodo: solo esa versión puede modificarlo en su lugar
 
     def esta_lleno(self, grado):
         return len(self.claves) == 2 * grado - 1
 
 
+# Hoja sin claves desde la que arranca un recorrido que empieza en una clave de un nodo interno
+HOJA_VACIA = NodoB(es_hoja=True)
+
+
+class UsoArbol:
+    """Contadores de trabajo de un árbol B, compartidos con sus instantáneas (aproximados con varios hilos)"""
+    __slots__ = ('nodos_visitados', 'descensos', 'divisiones')
+
+    def __init__(self):
+        self.nodos_visitados = 0  # Hijos leídos al bajar o recorrer (la raíz no cuenta)
+        # Bajadas desde la raíz con búsqueda binaria por nivel; contar cada comparación costaría un 25 % de la bajada
+        self.descensos = 0
+        self.divisiones = 0  # Nodos llenos divididos al insertar
+
+
 class ArbolB:
-    def __init__(self, grado=3):
-        self.raiz = NodoB(es_hoja=True)
+    """Árbol B con copia en escritura: los lectores usan instantanea() sin cerrojo mientras un escritor a la vez modifica"""
+
+    def __init__(self, grado=3, indexar=True, almacenamiento=None, nombre='proveedores', compacto=True):
         self.grado = grado  # Grado mínimo del árbol B
+        # En modo compacto los proveedores se guardan como tuplas y solo se convierten a diccionario al salir del árbol
+        self.compacto = compacto
+        # Con almacenamiento los nodos viven en páginas de disco y los hijos se guardan como números de página
+        self.almacenamiento = almacenamiento
+        self.nombre = nombre  # Nombre con el que se registran la raíz y las estadísticas en el almacenamiento
+        # Los nodos de versiones ya publicadas no se modifican: se copian (junto con su camino desde la raíz)
+        self.version = 1
+        self.cerrojo = threading.RLock()  # Serializa a los escritores; los lectores no lo toman
+        self.publicada = None  # Última instantánea de solo lectura entregada a los lectores
+        self.solo_lectura = False
+        self.modificaciones = 0  # Cambia con cada escritura: sirve de versión para cachear respuestas
+        self.uso = UsoArbol()
+        # Tamaño máximo de una clave con su registro: con él un nodo lleno nunca excede su página
+        self.maximo_entrada = almacenamiento.maximo_entrada(grado) if almacenamiento else None
+        if self.maximo_entrada is not None and self.maximo_entrada <= 0:
+            raise ValueError(f"Un nodo de grado {grado} no cabe en páginas de {almacenamiento.tamano_pagina} bytes")
+
+        guardado = almacenamiento.metadatos.get('arboles', {}).get(nombre) if almacenamiento else None
+        if guardado:
+            if guardado['grado'] != grado:
+                raise ValueError(f"El árbol '{nombre}' fue guardado con grado {guardado['grado']}, no {grado}")
+            self.raiz = almacenamiento.leer(guardado['raiz'])
+            self.total_nodos = guardado['total_nodos']
+            self.altura = guardado['altura']
+        else:
+            self.raiz = self._nuevo_nodo(es_hoja=True)
+            self._guardar(self.raiz)
+            self.total_nodos = 1  # Se actualizan en cada división para no recorrer el árbol
+            self.altura = 1
+
+        # Índices secundarios por campo que apuntan a los IDs: búsquedas y listados ordenados
+        self.indices = {}
+        if indexar:
+            self.indices = {
+                'servicio': IndiceSecundario('servicio', grado, internar=True,
+                                             almacenamiento=almacenamiento, prefijo=nombre),
+                'ubicacion': IndiceSecundario('ubicacion', grado, internar=True,
+                                              almacenamiento=almacenamiento, prefijo=nombre),
+                'nombre': IndiceSecundario('nombre', grado, almacenamiento=almacenamiento, prefijo=nombre),
+                'calificacion': IndiceSecundario('calificacion', grado, descendente=True,
+                                                 almacenamiento=almacenamiento, prefijo=nombre),
+                'palabras': IndiceNombres(grado, almacenamiento=almacenamiento, prefijo=nombre)
+            }
+            if guardado and len(self):
+                # Un índice agregado después de guardar el árbol se construye una vez al abrirlo
+                faltantes = [indice for indice in self.indices.values() if not len(indice)]
+                if faltantes:
+                    registros = list(self.rango())
+                    for indice in faltantes:
+                        indice.cargar_masivo(indice.preparar_lote(registros))
+        # Cantidad de proveedores por cada valor de servicio y de ubicación
+        self.contadores = {}
+        if indexar:
+            self.contadores = {'servicio': {}, 'ubicacion': {}}
+            if almacenamiento:
+                self.contadores.update(almacenamiento.metadatos.get('contadores', {}).get(nombre, {}))
+
+    def __len__(self):
+        return self.raiz.total
+
+    def _nuevo_nodo(self, es_hoja=False):
+        """Crea un nodo de la versión en curso y, si el árbol es paginado, le reserva una página"""
+        nodo = NodoB(es_hoja=es_hoja)
+        nodo.version = self.version
+        if self.almacenamiento:
+            nodo.pagina = self.almacenamiento.reservar()
+        return nodo
+
+    def _propio(self, nodo):
+        """Devuelve el nodo listo para modificarlo: el mismo si es de la versión en curso, si no una copia"""
+        if nodo.version == self.version:
+            return nodo
+        # Copia directa de los atributos, sin las listas vacías que crearía __init__
+        copia = NodoB.__new__(NodoB)
+        copia.es_hoja = nodo.es_hoja
+        copia.claves = nodo.claves[:]
+        copia.datos = nodo.datos[:]
+        copia.hijos = nodo.hijos if nodo.es_hoja else nodo.hijos[:]
+        copia.conteos = nodo.conteos if nodo.es_hoja else nodo.conteos[:]
+        copia.total = nodo.total
+        copia.version = self.version
+        copia.pagina = None
+        if self.almacenamiento:
+            copia.pagina = self.almacenamiento.reservar()
+            # La página anterior sigue visible para las instantáneas y la versión durable hasta que se recicle
+            self.almacenamiento.liberar(nodo.pagina)
+        return copia
+
+    def _hijo(self, nodo, indice):
+        """Obtiene un hijo del nodo, leyéndolo del almacenamiento si hace falta"""
+        self.uso.nodos_visitados += 1
+        hijo = nodo.hijos[indice]
+        if self.almacenamiento:
+            return self.almacenamiento.leer(hijo)
+        return hijo
+
+    def _referencia(self, nodo):
+        """Referencia que guarda el padre: el nodo mismo o su número de página"""
+        return nodo.pagina if self.almacenamiento else nodo
+
+    def _empacar(self, datos):
+        """Convierte los datos recibidos al registro que se guarda en el nodo"""
+        return Proveedor.empacar(datos) if self.compacto else datos
+
+    def _materializar(self, clave, registro):
+        """Convierte un registro guardado en el diccionario que se entrega fuera del árbol"""
+        return Proveedor.desempacar(clave, registro) if self.compacto else registro
+
+    def _guardar(self, nodo):
+        """Escribe el nodo modificado en su página (sin efecto para árboles en memoria)"""
+        if self.almacenamiento:
+            self.almacenamiento.escribir(nodo)
+
+    def _liberar_nodos(self, nodo):
+        """Devuelve al almacenamiento las páginas de un subárbol que ya no se usa"""
+        if not nodo.es_hoja:
+            for i in range(len(nodo.hijos)):
+                self._liberar_nodos(self._hijo(nodo, i))
+        self.almacenamiento.liberar(nodo.pagina)
+
+    def _metadatos(self):
+        """Datos necesarios para volver a abrir el árbol desde el almacenamiento"""
+        return {'raiz': self.raiz.pagina, 'total_nodos': self.total_nodos, 'altura': self.altura,
+                'grado': self.grado}
+
+    def sincronizar(self, **adicionales):
+        """Hace durables los cambios: guarda raíces, estadísticas y contadores del árbol y sus índices"""
+        if not self.almacenamiento:
+            return
+        self._verificar_escritura()
+        with self.cerrojo:
+            arboles = {self.nombre: self._metadatos()}
+            for indice in self.indices.values():
+                for arbol in indice.arboles():
+                    arboles[arbol.nombre] = arbol._metadatos()
+            self.almacenamiento.sincronizar(dict(adicionales, arboles=arboles,
+                                                 contadores={self.nombre: self.contadores}))
+
+    def instantanea(self):
+        """Versión de solo lectura del árbol completo (índices y contadores incluidos) que no cambia con las escrituras"""
+        if self.solo_lectura:
+            return self
+        publicada = self.publicada
+        if publicada is None:
+            with self.cerrojo:
+                if self.publicada is None:
+                    self._publicar()
+                publicada = self.publicada
+        return publicada
+
+    def _clonar(self):
+        """Copia superficial de solo lectura; desde aquí los nodos actuales quedan compartidos y se copian al escribir"""
+        clon = object.__new__(type(self))
+        clon.__dict__ = self.__dict__.copy()
+        clon.solo_lectura = True
+        clon.publicada = None
+        if self.indices:
+            clon.indices = {campo: indice._clonar() for campo, indice in self.indices.items()}
+            clon.contadores = {campo: dict(contador) for campo, contador in self.contadores.items()}
+        self.version += 1
+        return clon
+
+    def _publicar(self):
+        """Publica el estado actual para los lectores con una sola asignación (atómica)"""
+        clon = self._clonar()
+        if self.almacenamiento:
+            self.almacenamiento.registrar_instantanea(clon)
+        self.publicada = clon
+
+    def _verificar_escritura(self):
+        """Impide escribir sobre una instantánea, cuyos nodos comparte con el árbol vivo"""
+        if self.solo_lectura:
+            raise ValueError("La instantánea del árbol es de solo lectura")
+
+    def _verificar_entrada(self, clave, registro):
+        """Rechaza, antes de tocar ningún nodo, una entrada que no cabría en la página de un nodo lleno"""
+        if self.maximo_entrada is None:
+            return
+        tamano = self.almacenamiento.tamano_entrada(clave, registro)
+        if tamano > self.maximo_entrada:
+            raise RegistroDemasiadoGrande(
+                f"Una entrada del árbol '{self.nombre}' ocupa {tamano} bytes y el máximo con páginas de "
+                f"{self.almacenamiento.tamano_pagina} bytes y grado {self.grado} es {self.maximo_entrada}")
+
+    def _comprobar_clave(self, clave):
+        """Falla (TypeError) si la clave no se puede ordenar junto a las del árbol, antes de bajar por él"""
+        bisect_left(self.raiz.claves, clave)
+
+    def _preparar(self, clave, datos):
+        """Calcula sin modificar nada el registro, las entradas de los índices y los valores de los contadores"""
+        # Datos que no sirven (tipos, tamaño) fallan aquí y no con el árbol principal ya modificado
+        self._comprobar_clave(clave)
+        registro = self._empacar(datos)
+        self._verificar_entrada(clave, registro)
+        entradas = [(indice, indice.preparar(clave, datos)) for indice in self.indices.values()]
+        valores = [(contador, datos[campo]) for campo, contador in self.contadores.items()]
+        for _, valor in valores:
+            hash(valor)  # Un valor que no puede ser clave del contador falla antes de insertar
+        return registro, entradas, valores
 
     def insertar(self, clave, datos):
-        """Inserta una nueva clave con sus datos en el árbol B"""
+        """Inserta una nueva clave con sus datos en el árbol B y publica la nueva versión"""
+        self._verificar_escritura()
+        with self.cerrojo:
+            # Dentro del cerrojo: dos inserciones concurrentes de la misma clave no pueden pasar ambas
+            if self._buscar_registro(clave) is not None:
+                raise ClaveDuplicada(f"La clave ya existe: {clave!r}")
+            self._insertar(clave, datos)
+            self._publicar()
+
+    def _insertar(self, clave, datos, preparado=None):
+        """Inserta copiando los nodos compartidos del camino, sin publicar"""
+        registro, entradas, valores = preparado or self._preparar(clave, datos)
+        self.modificaciones += 1
         if self.raiz.esta_lleno(self.grado):
             # Si la raíz está llena, crear nueva raíz
-            nueva_raiz = NodoB()
-            nueva_raiz.hijos.append(self.raiz)
+            nueva_raiz = self._nuevo_nodo()
+            nueva_raiz.hijos.append(self._referencia(self.raiz))
+            nueva_raiz.conteos.append(self.raiz.total)
+            nueva_raiz.total = self.raiz.total
             self._dividir_hijo(nueva_raiz, 0)
             self.raiz = nueva_raiz
+            self.total_nodos += 1
+            self.altura += 1
+        else:
+            self.raiz = self._propio(self.raiz)
 
-        self._insertar_no_lleno(self.raiz, clave, datos)
+        self._insertar_no_lleno(self.raiz, clave, registro)
 
-    def _insertar_no_lleno(self, nodo, clave, datos):
-        """Inserta en un nodo que no está lleno"""
-        i = len(nodo.claves) - 1
+        # Mantener sincronizados los índices secundarios
+        for indice, entrada in entradas:
+            indice.agregar(clave, entrada)
+        for contador, valor in valores:
+            contador[valor] = contador.get(valor, 0) + 1
 
-        if nodo.es_hoja:
-            # Insertar en nodo hoja
-            nodo.claves.append(None)
-            nodo.datos.append(None)
+    def cargar_masivo(self, registros):
+        """Carga un lote de pares (clave, datos): construye el árbol de abajo hacia arriba o lo mezcla con el existente"""
+        self._verificar_escritura()
+        with self.cerrojo:
+            self._cargar_masivo(registros)
+            self._publicar()
 
-            while i >= 0 and clave < nodo.claves[i]:
-                nodo.claves[i + 1] = nodo.claves[i]
-                nodo.datos[i + 1] = nodo.datos[i]
-                i -= 1
+    def verificar_lote(self, registros):
+        """Comprueba sin modificar nada que el lote entraría completo con cargar_masivo (claves, tipos y tamaños)"""
+        registros = sorted(registros, key=lambda par: par[0])
+        for anterior, siguiente in zip(registros, registros[1:]):
+            if anterior[0] == siguiente[0]:
+                raise ClaveDuplicada(f"Clave duplicada en el lote: {siguiente[0]!r}")
+        for clave, datos in registros:
+            if self.buscar(clave) is not None:
+                raise ClaveDuplicada(f"La clave ya existe: {clave!r}")
+            self._preparar(clave, datos)
 
-            nodo.claves[i + 1] = clave
-            nodo.datos[i + 1] = datos
-        else:
-            # Encontrar el hijo donde insertar
-            while i >= 0 and clave < nodo.claves[i]:
-                i -= 1
-            i += 1
+    def _cargar_masivo(self, registros):
+        """Carga el lote sin publicar; el árbol anterior queda intacto para las instantáneas"""
+        registros = sorted(registros, key=lambda par: par[0])
+        for anterior, siguiente in zip(registros, registros[1:]):
+            if anterior[0] == siguiente[0]:
+                raise ClaveDuplicada(f"Clave duplicada en el lote: {siguiente[0]!r}")
+
+        if len(registros) < len(self) // FACTOR_MEZCLA:
+            # Lote pequeño frente al árbol: reconstruir costaría más que insertar
+            for clave, _ in registros:
+                if self.buscar(clave) is not None:
+                    raise ClaveDuplicada(f"La clave ya existe: {clave!r}")
+            # Todo el lote se prepara antes de la primera inserción: o entra completo o no entra nada
+            preparados = [self._preparar(clave, datos) for clave, datos in registros]
+            for (clave, datos), preparado in zip(registros, preparados):
+                self._insertar(clave, datos, preparado)
+            return
+
+        # Registros, entradas de los índices y sumas de los contadores, antes de reconstruir nada
+        empacados = [(clave, self._empacar(datos)) for clave, datos in registros]
+        if empacados:
+            self._comprobar_clave(empacados[0][0])
+        for clave, registro in empacados:
+            self._verificar_entrada(clave, registro)
+        lotes = [(indice, indice.preparar_lote(registros)) for indice in self.indices.values()]
+        sumas = [(contador, Counter(datos[campo] for _, datos in registros))
+                 for campo, contador in self.contadores.items()]
+        self.modificaciones += 1
+
+        # Mezclar en orden las claves existentes con las del lote (O(n + m))
+        existentes = self._rango_registros()
+        mezclados = list(heapq.merge(existentes, empacados, key=lambda par: par[0]))
+        for anterior, siguiente in zip(mezclados, mezclados[1:]):
+            if anterior[0] == siguiente[0]:
+                raise ClaveDuplicada(f"La clave ya existe: {siguiente[0]!r}")
+        raiz_anterior = self.raiz
+        self._construir_desde_ordenados([clave for clave, _ in mezclados], [datos for _, datos in mezclados])
+        if self.almacenamiento:
+            self._liberar_nodos(raiz_anterior)
 
-            if nodo.hijos[i].esta_lleno(self.grado):
+        for indice, lote in lotes:
+            indice.cargar_masivo(lote)
+        for contador, suma in sumas:
+            for valor, cantidad in suma.items():
+                contador[valor] = contador.get(valor, 0) + cantidad
+
+    def _construir_desde_ordenados(self, claves, datos):
+        """Construye el árbol nivel por nivel desde las hojas con nodos empacados (entre t-1 y 2t-1 claves)"""
+        capacidad = 2 * self.grado  # Claves de un nodo lleno más el separador que sube al padre
+        hijos = None
+        total_nodos = altura = 0
+
+        while True:
+            cantidad = max(1, -(-(len(claves) + 1) // capacidad))
+            # Repartir parejo las claves que quedan en el nivel; las demás suben como separadores
+            base, extra = divmod(len(claves) - (cantidad - 1), cantidad)
+            nodos, claves_padre, datos_padre = [], [], []
+            inicio = inicio_hijos = 0
+
+            for j in range(cantidad):
+                tamano = base + (1 if j < extra else 0)
+                nodo = self._nuevo_nodo(es_hoja=hijos is None)
+                nodo.claves = claves[inicio:inicio + tamano]
+                nodo.datos = datos[inicio:inicio + tamano]
+                nodo.total = tamano
+                if hijos is not None:
+                    grupo = hijos[inicio_hijos:inicio_hijos + tamano + 1]
+                    nodo.hijos = [self._referencia(hijo) for hijo in grupo]
+                    nodo.conteos = [hijo.total for hijo in grupo]
+                    nodo.total += sum(nodo.conteos)
+                    inicio_hijos += tamano + 1
+                self._guardar(nodo)
+                nodos.append(nodo)
+                inicio += tamano
+
+                if j < cantidad - 1:
+                    claves_padre.append(claves[inicio])
+                    datos_padre.append(datos[inicio])
+                    inicio += 1
+
+            total_nodos += cantidad
+            altura += 1
+            if cantidad == 1:
+                break
+            claves, datos, hijos = claves_padre, datos_padre, nodos
+
+        self.raiz = nodos[0]
+        self.total_nodos = total_nodos
+        self.altura = altura
+
+    def _insertar_no_lleno(self, nodo, clave, datos):
+        """Inserta bajando iterativamente desde un nodo que no está lleno, dividiendo los hijos llenos en el camino"""
+        self.uso.descensos += 1
+        while True:
+            nodo.total += 1  # La clave quedará dentro de este subárbol
+            i = bisect_right(nodo.claves, clave)
+
+            if nodo.es_hoja:
+                nodo.claves.insert(i, clave)
+                nodo.datos.insert(i, datos)
+                self._guardar(nodo)
+                return
+
+            hijo = self._hijo(nodo, i)
+            if hijo.esta_lleno(self.grado):
                 self._dividir_hijo(nodo, i)
                 if clave > nodo.claves[i]:
                     i += 1
+                hijo = self._hijo(nodo, i)
+            else:
+                hijo = self._propio(hijo)
+                nodo.hijos[i] = self._referencia(hijo)
+            nodo.conteos[i] += 1
 
-            self._insertar_no_lleno(nodo.hijos[i], clave, datos)
+            self._guardar(nodo)
+            nodo = hijo
 
     def _dividir_hijo(self, nodo_padre, indice):
-        """Divide un hijo lleno"""
+        """Divide un hijo lleno (el padre ya debe ser de la versión en curso)"""
         grado = self.grado
-        nodo_lleno = nodo_padre.hijos[indice]
-        nuevo_nodo = NodoB(es_hoja=nodo_lleno.es_hoja)
+        self.uso.divisiones += 1
+        nodo_lleno = self._propio(self._hijo(nodo_padre, indice))
+        nodo_padre.hijos[indice] = self._referencia(nodo_lleno)
+        nuevo_nodo = self._nuevo_nodo(es_hoja=nodo_lleno.es_hoja)
 
-        # Mover la mitad de las claves al nuevo nodo
+        # Guardar la clave media antes de recortar el nodo lleno
+        clave_media = nodo_lleno.claves[grado - 1]
+        datos_media = nodo_lleno.datos[grado - 1]
+
+        # Mover la mitad superior al nuevo nodo y recortar el lleno en su lugar
         nuevo_nodo.claves = nodo_lleno.claves[grado:]
         nuevo_nodo.datos = nodo_lleno.datos[grado:]
-        nodo_lleno.claves = nodo_lleno.claves[:grado - 1]
-        nodo_lleno.datos = nodo_lleno.datos[:grado - 1]
+        del nodo_lleno.claves[grado - 1:]
+        del nodo_lleno.datos[grado - 1:]
 
         # Si no es hoja, mover también los hijos
         if not nodo_lleno.es_hoja:
             nuevo_nodo.hijos = nodo_lleno.hijos[grado:]
-            nodo_lleno.hijos = nodo_lleno.hijos[:grado]
+            nuevo_nodo.conteos = nodo_lleno.conteos[grado:]
+            del nodo_lleno.hijos[grado:]
+            del nodo_lleno.conteos[grado:]
 
-        # Insertar la clave media en el padre
-        clave_media = nodo_lleno.claves[grado - 1]
-        datos_media = nodo_lleno.datos[grado - 1]
+        # Recalcular los conteos de ambas mitades (el total del padre no cambia)
+        nuevo_nodo.total = len(nuevo_nodo.claves) + sum(nuevo_nodo.conteos)
+        nodo_lleno.total -= nuevo_nodo.total + 1
+        self._guardar(nodo_lleno)
+        self._guardar(nuevo_nodo)
 
-        nodo_padre.hijos.insert(indice + 1, nuevo_nodo)
+        # Insertar la clave media en el padre (quien llama guarda el padre)
+        nodo_padre.hijos.insert(indice + 1, self._referencia(nuevo_nodo))
+        nodo_padre.conteos[indice] = nodo_lleno.total
+        nodo_padre.conteos.insert(indice + 1, nuevo_nodo.total)
         nodo_padre.claves.insert(indice, clave_media)
         nodo_padre.datos.insert(indice, datos_media)
+        self.total_nodos += 1
+
+    def eliminar(self, clave):
+        """Elimina una clave con sus datos y publica la nueva versión; devuelve los datos eliminados o None"""
+        self._verificar_escritura()
+        with self.cerrojo:
+            datos = self._eliminar(clave)
+            if datos is not None:
+                self._publicar()
+            return datos
+
+    def _eliminar(self, clave):
+        """Elimina copiando los nodos compartidos del camino, sin publicar; None si la clave no estaba"""
+        encontrado = next(self._rango_registros(clave, clave), None)
+        if encontrado is None:
+            return None
+        self.modificaciones += 1
+        datos = self._materializar(clave, encontrado[1])
+
+        self.raiz = self._propio(self.raiz)
+        self._eliminar_de(self.raiz, clave)
+        if not self.raiz.claves and not self.raiz.es_hoja:
+            # La raíz quedó sin claves tras fusionar sus dos únicos hijos: el árbol baja un nivel
+            anterior = self.raiz
+            self.raiz = self._hijo(anterior, 0)
+            if self.almacenamiento:
+                self.almacenamiento.liberar(anterior.pagina)
+            self.total_nodos -= 1
+            self.altura -= 1
+
+        # Mantener sincronizados los índices secundarios y los contadores
+        for indice in self.indices.values():
+            indice.quitar(clave, datos)
+        for campo, contador in self.contadores.items():
+            self._descontar(contador, datos[campo])
+        return datos
+
+    @staticmethod
+    def _descontar(contador, valor):
+        """Resta un proveedor al valor; los valores sin proveedores desaparecen de la distribución"""
+        if contador[valor] > 1:
+            contador[valor] -= 1
+        else:
+            del contador[valor]
+
+    def _eliminar_de(self, nodo, clave):
+        """Baja desde un nodo propio dejando en t claves o más cada hijo antes de entrar, para eliminar en una pasada"""
+        grado = self.grado
+        while True:
+            nodo.total -= 1  # La clave sale de este subárbol
+            i = bisect_left(nodo.claves, clave)
+            encontrada = i < len(nodo.claves) and nodo.claves[i] == clave
+
+            if nodo.es_hoja:
+                del nodo.claves[i]
+                del nodo.datos[i]
+                self._guardar(nodo)
+                return
+
+            if encontrada:
+                izquierdo = self._hijo(nodo, i)
+                derecho = self._hijo(nodo, i + 1)
+                if len(izquierdo.claves) >= grado:
+                    # Reemplazar por el predecesor y seguir bajando para eliminarlo del hijo izquierdo
+                    hijo = self._propio(izquierdo)
+                    nodo.hijos[i] = self._referencia(hijo)
+                    clave, nodo.datos[i] = self._extremo(hijo, ultimo=True)
+                    nodo.claves[i] = clave
+                elif len(derecho.claves) >= grado:
+                    # Reemplazar por el sucesor y seguir bajando para eliminarlo del hijo derecho
+                    i += 1
+                    hijo = self._propio(derecho)
+                    nodo.hijos[i] = self._referencia(hijo)
+                    clave, nodo.datos[i - 1] = self._extremo(hijo, ultimo=False)
+                    nodo.claves[i - 1] = clave
+                else:
+                    # Ambos hijos tienen t-1 claves: se fusionan con la clave en medio y se sigue en el resultado
+                    hijo = self._fusionar_hijos(nodo, i)
+            else:
+                hijo, i = self._reforzar_hijo(nodo, i)
+            nodo.conteos[i] -= 1
+
+            self._guardar(nodo)
+            nodo = hijo
+
+    def _extremo(self, nodo, ultimo):
+        """Clave y registro mínimos (o máximos con ultimo) del subárbol, sin modificarlo"""
+        while not nodo.es_hoja:
+            nodo = self._hijo(nodo, len(nodo.hijos) - 1 if ultimo else 0)
+        j = -1 if ultimo else 0
+        return nodo.claves[j], nodo.datos[j]
+
+    def _reforzar_hijo(self, nodo, i):
+        """Deja el hijo i listo para bajar (propio, con t claves o más) y lo devuelve con su índice tras fusionar"""
+        grado = self.grado
+        hijo = self._hijo(nodo, i)
+        izquierdo = derecho = None
+        if len(hijo.claves) < grado:
+            izquierdo = self._hijo(nodo, i - 1) if i > 0 else None
+            derecho = self._hijo(nodo, i + 1) if i < len(nodo.claves) else None
+            if not (izquierdo is not None and len(izquierdo.claves) >= grado or
+                    derecho is not None and len(derecho.claves) >= grado):
+                # Ningún hermano puede prestar: fusionar (lee los hijos de sus páginas, aún sin copiar)
+                i = i if derecho is not None else i - 1
+                return self._fusionar_hijos(nodo, i), i
+
+        hijo = self._propio(hijo)
+        nodo.hijos[i] = self._referencia(hijo)
+        if len(hijo.claves) >= grado:
+            return hijo, i
+        if izquierdo is not None and len(izquierdo.claves) >= grado:
+            # Rotar a la derecha: baja el separador i-1 al hijo y sube la última clave del hermano izquierdo
+            izquierdo = self._propio(izquierdo)
+            nodo.hijos[i - 1] = self._referencia(izquierdo)
+            hijo.claves.insert(0, nodo.claves[i - 1])
+            hijo.datos.insert(0, nodo.datos[i - 1])
+            nodo.claves[i - 1] = izquierdo.claves.pop()
+            nodo.datos[i - 1] = izquierdo.datos.pop()
+            movidos = 1
+            if not hijo.es_hoja:
+                hijo.hijos.insert(0, izquierdo.hijos.pop())
+                hijo.conteos.insert(0, izquierdo.conteos.pop())
+                movidos += hijo.conteos[0]
+            hijo.total += movidos
+            izquierdo.total -= movidos
+            nodo.conteos[i - 1] = izquierdo.total
+            self._guardar(izquierdo)
+        else:
+            # Rotar a la izquierda: baja el separador i al hijo y sube la primera clave del hermano derecho
+            derecho = self._propio(derecho)
+            nodo.hijos[i + 1] = self._referencia(derecho)
+            hijo.claves.append(nodo.claves[i])
+            hijo.datos.append(nodo.datos[i])
+            nodo.claves[i] = derecho.claves.pop(0)
+            nodo.datos[i] = derecho.datos.pop(0)
+            movidos = 1
+            if not hijo.es_hoja:
+                hijo.hijos.append(derecho.hijos.pop(0))
+                hijo.conteos.append(derecho.conteos.pop(0))
+                movidos += hijo.conteos[-1]
+            hijo.total += movidos
+            derecho.total -= movidos
+            nodo.conteos[i + 1] = derecho.total
+            self._guardar(derecho)
+        nodo.conteos[i] = hijo.total
+        return hijo, i
+
+    def _fusionar_hijos(self, nodo, i):
+        """Fusiona los hijos i e i+1 con el separador i en el hijo i (propio) y lo devuelve"""
+        izquierdo = self._propio(self._hijo(nodo, i))
+        nodo.hijos[i] = self._referencia(izquierdo)
+        derecho = self._hijo(nodo, i + 1)
+
+        izquierdo.claves.append(nodo.claves.pop(i))
+        izquierdo.datos.append(nodo.datos.pop(i))
+        izquierdo.claves.extend(derecho.claves)
+        izquierdo.datos.extend(derecho.datos)
+        if not izquierdo.es_hoja:
+            izquierdo.hijos.extend(derecho.hijos)
+            izquierdo.conteos.extend(derecho.conteos)
+        izquierdo.total += 1 + derecho.total
+        del nodo.hijos[i + 1]
+        del nodo.conteos[i + 1]
+        nodo.conteos[i] = izquierdo.total
+
+        # El hermano derecho deja de usarse; las instantáneas que lo leen conservan su página hasta reciclarla
+        if self.almacenamiento:
+            self.almacenamiento.liberar(derecho.pagina)
+        self.total_nodos -= 1
+        return izquierdo
+
+    def actualizar(self, clave, cambios):
+        """Cambia campos de un proveedor en su lugar (sin eliminar y reinsertar) y publica; devuelve los datos o None"""
+        self._verificar_escritura()
+        with self.cerrojo:
+            datos = self._actualizar(clave, cambios)
+            if datos is not None:
+                self._publicar()
+            return datos
+
+    def _actualizar(self, clave, cambios):
+        """Reemplaza los datos copiando solo el camino hasta el nodo de la clave, sin publicar"""
+        if cambios.get('id', clave) != clave:
+            raise ValueError("El ID es la clave del árbol y no se puede cambiar")
+        encontrado = next(self._rango_registros(clave, clave), None)
+        if encontrado is None:
+            return None
+        anteriores = self._materializar(clave, encontrado[1])
+        datos = dict(anteriores, **cambios)
+        self._preparar(clave, datos)  # Tipos y tamaños del resultado, antes de tocar ningún nodo
+        self.modificaciones += 1
+
+        self.raiz = nodo = self._propio(self.raiz)
+        while True:
+            i = bisect_left(nodo.claves, clave)
+            if i < len(nodo.claves) and nodo.claves[i] == clave:
+                nodo.datos[i] = self._empacar(datos)
+                self._guardar(nodo)
+                break
+            hijo = self._propio(self._hijo(nodo, i))
+            nodo.hijos[i] = self._referencia(hijo)
+            self._guardar(nodo)
+            nodo = hijo
+
+        # Solo cambian los índices y contadores de los campos modificados
+        for indice in self.indices.values():
+            indice.actualizar(clave, anteriores, datos)
+        for campo, contador in self.contadores.items():
+            if anteriores[campo] != datos[campo]:
+                self._descontar(contador, anteriores[campo])
+                contador[datos[campo]] = contador.get(datos[campo], 0) + 1
+        return datos
 
     def buscar(self, clave):
         """Busca una clave específica en el árbol"""
-        return self._buscar_en_nodo(self.raiz, clave)
+        registro = self._buscar_registro(clave)
+        if registro is None:
+            return None
+        return self._materializar(clave, registro)
 
-    def _buscar_en_nodo(self, nodo, clave):
-        """Busca en un nodo específico"""
-        i = 0
-        while i < len(nodo.claves) and clave > nodo.claves[i]:
-            i += 1
+    def _buscar_registro(self, clave):
+        """Baja iterativamente desde la raíz con búsqueda binaria en cada nodo"""
+        self.uso.descensos += 1
+        nodo = self.raiz
+        while True:
+            i = bisect_left(nodo.claves, clave)
+            if i < len(nodo.claves) and nodo.claves[i] == clave:
+                return nodo.datos[i]
+            if nodo.es_hoja:
+                return None
+            nodo = self._hijo(nodo, i)
 
-        if i < len(nodo.claves) and clave == nodo.claves[i]:
-            return nodo.datos[i]
+    def rango(self, desde=None, hasta=None):
+        """Generador que recorre en orden los pares (clave, datos) con desde <= clave <= hasta"""
+        recorrido = self._rango_registros(desde, hasta)
+        if self.compacto:
+            return ((clave, Proveedor.desempacar(clave, registro)) for clave, registro in recorrido)
+        return recorrido
 
-        if nodo.es_hoja:
-            return None
+    def _rango_registros(self, desde=None, hasta=None):
+        """Recorrido en orden de los registros guardados, bajando solo por el camino de la primera clave >= desde"""
+        self.uso.descensos += desde is not None
+        pila = []
+        nodo = self.raiz
+        while True:
+            i = 0 if desde is None else bisect_left(nodo.claves, desde)
+            if nodo.es_hoja:
+                return self._recorrer(pila, nodo, i, hasta)
+            pila.append((nodo, i))
+            nodo = self._hijo(nodo, i)
 
-        return self._buscar_en_nodo(nodo.hijos[i], clave)
+    def recorrer_desde_posicion(self, posicion):
+        """Generador que recorre en orden los pares (clave, datos) a partir de la posición dada"""
+        recorrido = self._recorrer(*self._descender_a_posicion(posicion), None)
+        if self.compacto:
+            return ((clave, Proveedor.desempacar(clave, registro)) for clave, registro in recorrido)
+        return recorrido
+
+    def _descender_a_posicion(self, posicion):
+        """Baja hasta la posición dada saltando los subárboles completos anteriores con sus conteos"""
+        pila = []
+        nodo = self.raiz
+        while not nodo.es_hoja:
+            for i, conteo in enumerate(nodo.conteos):
+                if posicion < conteo:
+                    break
+                posicion -= conteo
+                if i == len(nodo.claves):
+                    return [], HOJA_VACIA, 0  # Posición fuera del árbol
+                if posicion == 0:
+                    # La posición es la clave i de este nodo: se entrega al subir
+                    pila.append((nodo, i))
+                    return pila, HOJA_VACIA, 0
+                posicion -= 1
+            pila.append((nodo, i))
+            nodo = self._hijo(nodo, i)
+        return pila, nodo, posicion
+
+    def _recorrer(self, pila, nodo, i, hasta):
+        """Sigue el recorrido en orden desde la posición i de una hoja; la pila guarda (ancestro, clave pendiente)"""
+        while True:
+            if nodo.es_hoja:
+                for j in range(i, len(nodo.claves)):
+                    if hasta is not None and nodo.claves[j] > hasta:
+                        return
+                    yield nodo.claves[j], nodo.datos[j]
+
+                # Subir al primer ancestro que tenga claves pendientes
+                while pila:
+                    nodo, i = pila.pop()
+                    if i < len(nodo.claves):
+                        break
+                else:
+                    return
+                if hasta is not None and nodo.claves[i] > hasta:
+                    return
+                yield nodo.claves[i], nodo.datos[i]
+                i += 1
+
+            # Bajar por el extremo izquierdo del hijo i
+            pila.append((nodo, i))
+            nodo = self._hijo(nodo, i)
+            i = 0
+
+    def posicion(self, clave, incluir=False):
+        """Cantidad de claves menores que 'clave' (menores o iguales con incluir) leyendo solo el camino: O(log n)"""
+        buscar = bisect_right if incluir else bisect_left
+        self.uso.descensos += 1
+        nodo = self.raiz
+        posicion = 0
+        while True:
+            i = buscar(nodo.claves, clave)
+            if nodo.es_hoja:
+                return posicion + i
+            posicion += i + sum(nodo.conteos[:i])
+            nodo = self._hijo(nodo, i)
+
+    def contar_rango(self, desde=None, hasta=None):
+        """Cantidad de claves con desde <= clave <= hasta sin recorrerlas"""
+        inicio = 0 if desde is None else self.posicion(desde)
+        fin = len(self) if hasta is None else self.posicion(hasta, incluir=True)
+        return max(0, fin - inicio)
 
     def buscar_por_servicio(self, tipo_servicio):
         """Busca todos los proveedores de un tipo de servicio específico"""
-        resultados = []
-        self._buscar_servicio_en_nodo(self.raiz, tipo_servicio.lower(), resultados)
-        return resultados
-
-    def _buscar_servicio_en_nodo(self, nodo, tipo_servicio, resultados):
-        """Busca por servicio en un nodo específico"""
-        # Buscar en las claves del nodo actual
-        for datos in nodo.datos:
-            if datos['servicio'].lower() == tipo_servicio:
-                resultados.append(datos)
-
-        # Si no es hoja, buscar en todos los hijos
-        if not nodo.es_hoja:
-            for hijo in nodo.hijos:
-                self._buscar_servicio_en_nodo(hijo, tipo_servicio, resultados)
+        return list(self.iterar_por('servicio', tipo_servicio))
 
     def buscar_por_ubicacion(self, ubicacion):
         """Busca todos los proveedores de una ubicación específica"""
-        resultados = []
-        self._buscar_ubicacion_en_nodo(self.raiz, ubicacion.lower(), resultados)
-        return resultados
-
-    def _buscar_ubicacion_en_nodo(self, nodo, ubicacion, resultados):
-        """Busca por ubicación en un nodo específico"""
-        # Buscar en las claves del nodo actual
-        for datos in nodo.datos:
-            if datos['ubicacion'].lower() == ubicacion:
-                resultados.append(datos)
-
-        # Si no es hoja, buscar en todos los hijos
-        if not nodo.es_hoja:
-            for hijo in nodo.hijos:
-                self._buscar_ubicacion_en_nodo(hijo, ubicacion, resultados)
+        return list(self.iterar_por('ubicacion', ubicacion))
+
+    def iterar_por(self, campo, valor):
+        """Generador de los proveedores con el valor dado en un campo indexado, en orden de ID"""
+        for clave in self.indices[campo].ids_en_rango(valor, valor):
+            yield self.buscar(clave)
+
+    def contar_por(self, campo, valor):
+        """Cantidad de proveedores con el valor dado en un campo indexado, sin recorrerlos"""
+        return self.indices[campo].contar(valor, valor)
+
+    def buscar_nombre(self, texto, limite=10, aproximada=True):
+        """Busca por nombre con las palabras como prefijos (autocompletar) y, si no alcanzan, parecidas (errores de tipeo)"""
+        indice = self.indices['palabras']
+        consulta = palabras(texto)
+        if not consulta or limite <= 0:
+            return []
+        mejores = []  # Pares (clave_coincidencia, resultado) de los 'limite' mejores hasta ahora, ordenados
+        vistos = set()
+
+        def agregar(clave, puntaje_palabra):
+            """Verifica el candidato contra todas las palabras de la consulta y lo agrega con su puntaje"""
+            if clave in vistos:
+                return
+            vistos.add(clave)
+            datos = self.buscar(clave)
+            propias = palabras(datos['nombre'])
+            puntajes = [max((puntaje_palabra(palabra, propia) for propia in propias), default=0)
+                        for palabra in consulta]
+            if all(puntajes):
+                exacta = all(any(propia.startswith(palabra) for propia in propias) for palabra in consulta)
+                resultado = {'proveedor': datos, 'puntaje': round(sum(puntajes) / len(puntajes), 3),
+                             'coincidencia': 'prefijo' if exacta else 'aproximada'}
+                insort(mejores, (clave_coincidencia(resultado), resultado))
+                del mejores[limite:]
+
+        def recorrer(grupos, puntaje_palabra, aproximados):
+            """Agrega los proveedores de cada (puntaje de la guía, palabra), de mayor a menor puntaje, mientras puedan entrar"""
+            for puntaje_guia, palabra in grupos:
+                # Lo más que puede sumar un candidato de la palabra: la guía y el resto de la consulta completo
+                tope = (aproximados, -round((puntaje_guia + len(consulta) - 1) / len(consulta), 3))
+                if len(mejores) == limite and tope > mejores[-1][0][:2]:
+                    return  # Las palabras siguientes puntúan igual o menos
+                for clave in indice.ids_con_prefijo(palabra, exacta=True):
+                    if len(mejores) == limite and tope + (clave,) > mejores[-1][0]:
+                        break  # Los IDs siguientes de la palabra son mayores y tampoco entran
+                    agregar(clave, puntaje_palabra)
+
+        # 1) Prefijos: guía la palabra con menos proveedores; sus palabras se recorren de la más corta a la más larga
+        def por_prefijo(palabra, propia):
+            return len(palabra) / len(propia) if propia.startswith(palabra) else 0
+
+        guia = min(consulta, key=indice.contar_prefijo)
+        recorrer(sorted(((len(guia) / len(palabra), palabra) for palabra in indice.palabras_con_prefijo(guia)),
+                        key=lambda grupo: -grupo[0]), por_prefijo, False)
+
+        # 2) Aproximada: palabras con trigramas en común, solo si los prefijos no llenaron el límite
+        if aproximada and len(mejores) < limite:
+            similares = {palabra: dict(indice.similares(palabra)) for palabra in consulta}
+
+            def por_similitud(palabra, propia):
+                return por_prefijo(palabra, propia) or similares[palabra].get(propia, 0)
+
+            def costo(palabra):
+                """Proveedores que habría que verificar si la palabra guía la búsqueda"""
+                return indice.contar_prefijo(palabra) + sum(map(indice.contar_palabra, similares[palabra]))
+
+            # Guía la palabra con menos candidatos; los que tienen un prefijo de la guía ya se vieron en el paso 1
+            guia = min(consulta, key=costo)
+            parecidas = sorted(similares[guia].items(), key=lambda par: par[1], reverse=True)
+            recorrer(((similitud, palabra) for palabra, similitud in parecidas), por_similitud, True)
+
+        return [resultado for _, resultado in mejores]
 
     def obtener_todos_ordenados(self, orden_por='nombre'):
         """Obtiene todos los proveedores ordenados"""
-        todos = []
-        self._recorrer_inorden(self.raiz, todos)
-
-        if orden_por == 'nombre':
-            return sorted(todos, key=lambda x: x['nombre'].lower())
-        elif orden_por == 'calificacion':
-            return sorted(todos, key=lambda x: x['calificacion'], reverse=True)
-        elif orden_por == 'ubicacion':
-            return sorted(todos, key=lambda x: x['ubicacion'].lower())
-        else:
-            return todos
+        return list(self.iterar_ordenados(orden_por))
 
-    def _recorrer_inorden(self, nodo, resultado):
-        """Recorre el árbol en orden"""
-        if nodo.es_hoja:
-            for datos in nodo.datos:
-                resultado.append(datos)
+    def iterar_ordenados(self, orden_por='nombre', desplazamiento=0):
+        """Generador de los proveedores ordenados por un campo con índice (por ID si no lo tiene) desde una posición"""
+        if orden_por in ORDENES:
+            for clave in self.indices[orden_por].ids_desde_posicion(desplazamiento):
+                yield self.buscar(clave)
         else:
-            for i in range(len(nodo.claves)):
-                self._recorrer_inorden(nodo.hijos[i], resultado)
-                resultado.append(nodo.datos[i])
-            self._recorrer_inorden(nodo.hijos[-1], resultado)
+            for _, datos in self.recorrer_desde_posicion(desplazamiento):
+                yield datos
+
+    def obtener_pagina_ordenada(self, orden_por, desplazamiento=0, limite=None):
+        """Obtiene una página del listado ordenado por un campo sin reordenar (O(log n) hasta el inicio)"""
+        if orden_por not in ORDENES:
+            raise ValueError(f"Orden no soportado: {orden_por}")
+        return list(islice(self.iterar_ordenados(orden_por, desplazamiento), limite))
 
     def obtener_estadisticas(self):
         """Obtiene estadísticas del árbol"""
-        total_nodos = self._contar_nodos(self.raiz)
-        total_proveedores = len(self.obtener_todos_ordenados())
-        altura = self._obtener_altura(self.raiz)
-
         return {
-            'total_nodos': total_nodos,
-            'total_proveedores': total_proveedores,
-            'altura': altura,
+            'total_nodos': self.total_nodos,
+            'total_proveedores': len(self),
+            'altura': self.altura,
             'grado': self.grado
         }
 
-    def _contar_nodos(self, nodo):
-        """Cuenta el total de nodos en el árbol"""
-        if nodo.es_hoja:
-            return 1
+    def obtener_uso(self):
+        """Contadores de trabajo y forma del árbol principal y de cada árbol de índice, por nombre"""
+        uso = {}
+        for arbol in (self,) + tuple(arbol for indice in self.indices.values() for arbol in indice.arboles()):
+            # Cada bajada hace una búsqueda binaria por nivel sobre nodos con el promedio de claves del árbol
+            claves_por_nodo = len(arbol) // arbol.total_nodos
+            uso[arbol.nombre] = {
+                'nodos_visitados': arbol.uso.nodos_visitados,
+                'descensos': arbol.uso.descensos,
+                'comparaciones_estimadas': arbol.uso.descensos * arbol.altura * (claves_por_nodo.bit_length() or 1),
+                'divisiones': arbol.uso.divisiones,
+                'claves': len(arbol),
+                'total_nodos': arbol.total_nodos,
+                'altura': arbol.altura
+            }
+        return uso
+
+    def obtener_distribucion(self, campo):
+        """Obtiene la cantidad de proveedores por cada valor del campo (servicio o ubicación)"""
+        return dict(self.contadores[campo])
+
+    def consultar(self, servicio=None, ubicacion=None, calificacion_min=None, calificacion_max=None,
+                  id_desde=None, id_hasta=None, orden='id', limite=None):
+        """Consulta combinada: todos los filtros a la vez, ordenada por 'orden' y cortada en 'limite'"""
+        return self.ejecutar_plan(self.planificar(servicio, ubicacion, calificacion_min, calificacion_max,
+                                                  id_desde, id_hasta, orden, limite))
+
+    def planificar(self, servicio=None, ubicacion=None, calificacion_min=None, calificacion_max=None,
+                   id_desde=None, id_hasta=None, orden='id', limite=None):
+        """Elige el camino de acceso más barato para la consulta según los conteos exactos de cada filtro"""
+        if orden != 'id' and orden not in ORDENES:
+            raise ValueError(f"Orden no soportado: {orden}")
+        if limite is not None and limite < 1:
+            raise ValueError("El límite debe ser positivo")
+
+        # Rangos (mínimo, máximo) de cada campo filtrado, en valores originales
+        filtros = {}
+        if servicio is not None:
+            filtros['servicio'] = (servicio, servicio)
+        if ubicacion is not None:
+            filtros['ubicacion'] = (ubicacion, ubicacion)
+        if calificacion_min is not None or calificacion_max is not None:
+            filtros['calificacion'] = (calificacion_min, calificacion_max)
+
+        # Filas que entrega cada camino (O(log n) por conteo) y órdenes en que las entrega
+        total = len(self)
+        caminos = {'id': (self.contar_rango(id_desde, id_hasta), ('id',))}
+        for campo in FILTROS_IGUALDAD + FILTROS_RANGO + ('nombre',):
+            if campo in filtros or campo == orden:
+                minimo, maximo = filtros.get(campo, (None, None))
+                # Con un solo valor el índice entrega los empates por ID, es decir en orden de ID
+                ordenes = (campo, 'id') if campo in FILTROS_IGUALDAD else (campo,)
+                caminos[campo] = (self.indices[campo].contar(minimo, maximo), ordenes)
+
+        # Filas que cumplen todo, suponiendo filtros independientes
+        fraccion = 1.0
+        for campo in filtros:
+            fraccion *= caminos[campo][0] / total if total else 0.0
+        if id_desde is not None or id_hasta is not None:
+            fraccion *= caminos['id'][0] / total if total else 0.0
+        estimadas = total * fraccion
+
+        costos = {}
+        for nombre, (cantidad, ordenes) in caminos.items():
+            filas = cantidad
+            if orden in ordenes and limite is not None and estimadas:
+                # En el orden pedido se para al llegar al límite: se leen las filas hasta reunir 'limite' coincidencias
+                filas = min(cantidad, -(-limite * cantidad // estimadas))
+            costos[nombre] = filas * (1 if nombre == 'id' else COSTO_FILA_INDICE)
+        camino = min(costos, key=lambda nombre: (costos[nombre], orden not in caminos[nombre][1]))
+
+        # Los demás filtros con pocas filas se intersecan como conjuntos de IDs antes de leer los registros
+        filas_camino = costos[camino] // (1 if camino == 'id' else COSTO_FILA_INDICE)
+        intersecciones = [campo for campo in filtros if campo != camino and caminos[campo][0] <= filas_camino]
+
+        return {
+            'camino': camino,
+            'ordenado': orden in caminos[camino][1],
+            'intersecciones': intersecciones,
+            'filas_por_camino': {nombre: cantidad for nombre, (cantidad, _) in caminos.items()},
+            'filas_estimadas': round(estimadas),
+            'filtros': filtros,
+            'id_desde': id_desde,
+            'id_hasta': id_hasta,
+            'orden': orden,
+            'limite': limite
+        }
+
+    def ejecutar_plan(self, plan):
+        """Ejecuta un plan de planificar(): recorre el camino elegido, filtra y corta en el límite"""
+        camino, filtros = plan['camino'], plan['filtros']
+        id_desde, id_hasta = plan['id_desde'], plan['id_hasta']
+        conjuntos = [set(self.indices[campo].ids_en_rango(*filtros[campo])) for campo in plan['intersecciones']]
+        pendientes = [campo for campo in filtros if campo != camino and campo not in plan['intersecciones']]
+
+        def candidatos():
+            """Pares (id, registro) del camino elegido que pasan los filtros sobre el ID"""
+            if camino == 'id':
+                for clave, registro in self._rango_registros(id_desde, id_hasta):
+                    if all(clave in conjunto for conjunto in conjuntos):
+                        yield clave, registro
+                return
+            minimo, maximo = filtros.get(camino, (None, None))
+            for clave in self.indices[camino].ids_en_rango(minimo, maximo):
+                if id_desde is not None and clave < id_desde or id_hasta is not None and clave > id_hasta:
+                    continue
+                if all(clave in conjunto for conjunto in conjuntos):
+                    yield clave, self._buscar_registro(clave)
+
+        def coincidencias():
+            """Proveedores de los candidatos que cumplen los filtros que quedan"""
+            for clave, registro in candidatos():
+                datos = self._materializar(clave, registro)
+                if all(self.indices[campo].contiene(datos[campo], *filtros[campo]) for campo in pendientes):
+                    yield datos
+
+        if plan['ordenado']:
+            return list(islice(coincidencias(), plan['limite']))
+
+        # El camino no entrega el orden pedido: se ordenan todas las coincidencias
+        clave_orden = self.clave_orden(plan['orden'])
+        if plan['limite'] is None:
+            return sorted(coincidencias(), key=clave_orden)
+        return heapq.nsmallest(plan['limite'], coincidencias(), key=clave_orden)
+
+    def clave_orden(self, orden='id'):
+        """Función que da a un proveedor su lugar en el orden por ID o por un campo con índice"""
+        if orden == 'id':
+            return lambda datos: datos['id']
+        indice = self.indices[orden]
+        return lambda datos: (indice.normalizar(datos[indice.campo]), datos['id'])
+
+
+class IndiceSecundario:
+    """Índice secundario sobre un campo: árbol B con claves (valor normalizado, id)"""
+
+    def __init__(self, campo, grado=3, descendente=False, internar=False, almacenamiento=None, prefijo='proveedores'):
+        self.campo = campo
+        self.descendente = descendente  # Orden de mayor a menor (p. ej. calificación)
+        self.internar = internar  # Compartir en memoria los valores repetidos (servicio, ubicación)
+        self.arbol = ArbolB(grado, indexar=False, almacenamiento=almacenamiento, nombre=f'{prefijo}.{campo}',
+                            compacto=False)
+
+    def __len__(self):
+        return len(self.arbol)
+
+    def arboles(self):
+        """Árboles B del índice, para sincronizarlos"""
+        return self.arbol,
+
+    def _clonar(self):
+        """Copia de solo lectura del índice para una instantánea"""
+        clon = object.__new__(IndiceSecundario)
+        clon.__dict__ = self.__dict__.copy()
+        clon.arbol = self.arbol._clonar()
+        return clon
+
+    def normalizar(self, valor):
+        """Normaliza el valor: texto sin distinguir mayúsculas y negado si el orden es descendente"""
+        if isinstance(valor, str):
+            valor = sys.intern(valor.lower()) if self.internar else valor.lower()
+        return -valor if self.descendente else valor
+
+    def preparar(self, clave, datos):
+        """Entrada del proveedor en el índice, ya comprobada (orden y tamaño) y sin modificar nada"""
+        entrada = (self.normalizar(datos[self.campo]), clave)
+        return entrada, self.arbol._preparar(entrada, None)
+
+    def agregar(self, clave, entrada):
+        """Registra el ID del proveedor bajo el valor de su campo (entrada de preparar)"""
+        clave_indice, preparado = entrada
+        self.arbol._insertar(clave_indice, None, preparado)
+
+    def preparar_lote(self, registros):
+        """Entradas ordenadas de un lote de pares (id, datos), comprobadas sin modificar nada"""
+        entradas = sorted((self.normalizar(datos[self.campo]), clave) for clave, datos in registros)
+        if entradas:
+            self.arbol._comprobar_clave(entradas[0])
+        for entrada in entradas:
+            self.arbol._verificar_entrada(entrada, None)
+        return entradas
+
+    def cargar_masivo(self, entradas):
+        """Registra en bloque las entradas de preparar_lote"""
+        self.arbol._cargar_masivo([(entrada, None) for entrada in entradas])
+
+    def quitar(self, clave, datos):
+        """Borra el ID del proveedor del valor de su campo"""
+        self.arbol._eliminar((self.normalizar(datos[self.campo]), clave))
+
+    def actualizar(self, clave, anteriores, datos):
+        """Mueve el ID al nuevo valor del campo si cambió"""
+        anterior, nuevo = self.normalizar(anteriores[self.campo]), self.normalizar(datos[self.campo])
+        if anterior != nuevo:
+            self.arbol._eliminar((anterior, clave))
+            self.arbol._insertar((nuevo, clave), None)
+
+    def buscar(self, valor):
+        """Devuelve, ordenados, los IDs de los proveedores con el valor dado"""
+        return list(self.ids_en_rango(valor, valor))
+
+    def _limites(self, minimo=None, maximo=None):
+        """Claves del índice que encierran los valores entre minimo y maximo (incluidos; None = sin límite)"""
+        minimo = None if minimo is None else self.normalizar(minimo)
+        maximo = None if maximo is None else self.normalizar(maximo)
+        if self.descendente:
+            minimo, maximo = maximo, minimo  # Al negar los valores se invierten los extremos
+        return (None if minimo is None else (minimo,)), (None if maximo is None else (maximo, MAXIMO_ID))
+
+    def ids_en_rango(self, minimo=None, maximo=None):
+        """Generador de IDs con el valor entre minimo y maximo, en el orden del índice"""
+        desde, hasta = self._limites(minimo, maximo)
+        for (_, clave), _ in self.arbol._rango_registros(desde, hasta):
+            yield clave
+
+    def contar(self, minimo=None, maximo=None):
+        """Cantidad de proveedores con el valor entre minimo y maximo, leyendo solo dos caminos del árbol"""
+        return self.arbol.contar_rango(*self._limites(minimo, maximo))
+
+    def contiene(self, valor, minimo=None, maximo=None):
+        """Indica si un valor del campo está entre minimo y maximo con la misma normalización del índice"""
+        valor = self.normalizar(valor)
+        desde, hasta = self._limites(minimo, maximo)
+        return (desde is None or valor >= desde[0]) and (hasta is None or valor <= hasta[0])
+
+    def ids_desde_posicion(self, posicion=0):
+        """Generador de IDs en el orden del índice (empates por ID) a partir de una posición"""
+        for (_, clave), _ in self.arbol.recorrer_desde_posicion(posicion):
+            yield clave
+
+
+class IndiceNombres:
+    """Índice de búsqueda por nombre: árbol B de (palabra, id) para prefijos y de (trigrama, palabra) para parecidas"""
+
+    def __init__(self, grado=3, almacenamiento=None, prefijo='proveedores'):
+        # Las claves ordenadas hacen de trie: las palabras con un prefijo forman un rango contiguo
+        self.palabras = ArbolB(grado, indexar=False, almacenamiento=almacenamiento, nombre=f'{prefijo}.palabras',
+                               compacto=False)
+        # Trigramas del vocabulario (no de cada proveedor): una palabra repetida se indexa una sola vez
+        self.trigramas = ArbolB(grado, indexar=False, almacenamiento=almacenamiento, nombre=f'{prefijo}.trigramas',
+                                compacto=False)
+
+    def __len__(self):
+        return len(self.palabras)
+
+    def arboles(self):
+        """Árboles B del índice, para sincronizarlos"""
+        return self.palabras, self.trigramas
+
+    def _clonar(self):
+        """Copia de solo lectura del índice para una instantánea"""
+        clon = object.__new__(IndiceNombres)
+        clon.palabras = self.palabras._clonar()
+        clon.trigramas = self.trigramas._clonar()
+        return clon
+
+    def _nuevas(self, vocabulario):
+        """Claves (trigrama, palabra) de las palabras que todavía no están en el índice; los números no se aproximan"""
+        return [(trigrama, palabra) for palabra in sorted(vocabulario)
+                if not palabra.isdigit() and not self.contar_palabra(palabra)
+                for trigrama in trigramas(palabra)]
+
+    def _verificar_palabra(self, palabra, clave):
+        """Comprueba que las entradas de una palabra caben en las páginas del índice"""
+        if self.palabras.maximo_entrada is None:
+            return
+        self.palabras._verificar_entrada((palabra, clave), None)
+        if not palabra.isdigit():
+            # La entrada más grande de la palabra es la de su trigrama de más bytes
+            trigrama = max(trigramas(palabra), key=lambda texto: len(texto.encode()))
+            self.trigramas._verificar_entrada((trigrama, palabra), None)
+
+    def preparar(self, clave, datos):
+        """Palabras del nombre del proveedor, comprobadas sin modificar nada (falla si el nombre no es texto)"""
+        propias = set(palabras(datos['nombre']))
+        for palabra in propias:
+            self._verificar_palabra(palabra, clave)
+        return propias
+
+    def agregar(self, clave, propias):
+        """Registra las palabras del nombre del proveedor (de preparar)"""
+        for trigrama in self._nuevas(propias):
+            self.trigramas._insertar(trigrama, None)
+        for palabra in propias:
+            self.palabras._insertar((palabra, clave), None)
+
+    def quitar(self, clave, datos, conservar=()):
+        """Borra las palabras del nombre del proveedor; las que ya no tiene nadie salen también del vocabulario"""
+        for palabra in set(palabras(datos['nombre'])).difference(conservar):
+            self.palabras._eliminar((palabra, clave))
+            if not palabra.isdigit() and not self.contar_palabra(palabra):
+                for trigrama in trigramas(palabra):
+                    self.trigramas._eliminar((trigrama, palabra))
+
+    def actualizar(self, clave, anteriores, datos):
+        """Cambia solo las palabras que difieren entre el nombre anterior y el nuevo"""
+        if anteriores['nombre'] == datos['nombre']:
+            return
+        nuevas = set(palabras(datos['nombre']))
+        previas = set(palabras(anteriores['nombre']))
+        self.quitar(clave, anteriores, conservar=nuevas)
+        for trigrama in self._nuevas(nuevas - previas):
+            self.trigramas._insertar(trigrama, None)
+        for palabra in nuevas - previas:
+            self.palabras._insertar((palabra, clave), None)
+
+    def preparar_lote(self, registros):
+        """Pares (palabra, id) de los nombres de un lote de pares (id, datos), comprobados sin modificar nada"""
+        pares = {(palabra, clave) for clave, datos in registros for palabra in palabras(datos['nombre'])}
+        for palabra, clave in pares:
+            self._verificar_palabra(palabra, clave)
+        return pares
+
+    def cargar_masivo(self, pares):
+        """Registra en bloque los pares de preparar_lote"""
+        nuevas = self._nuevas({palabra for palabra, _ in pares})
+        self.trigramas._cargar_masivo([(trigrama, None) for trigrama in nuevas])
+        self.palabras._cargar_masivo([(par, None) for par in pares])
+
+    def contar_palabra(self, palabra):
+        """Cantidad de proveedores con la palabra exacta"""
+        return self.palabras.contar_rango((palabra,), (palabra, MAXIMO_ID))
+
+    def contar_prefijo(self, prefijo):
+        """Cantidad de pares (palabra, proveedor) con palabras que empiezan con el prefijo, leyendo solo dos caminos"""
+        return self.palabras.contar_rango((prefijo,), (prefijo + MAXIMO_TEXTO,))
 
-        total = 1
-        for hijo in nodo.hijos:
-            total += self._contar_nodos(hijo)
-        return total
+    def palabras_con_prefijo(self, prefijo):
+        """Generador de las palabras distintas que empiezan con el prefijo, en orden alfabético, con un descenso por palabra"""
+        desde = (prefijo,)
+        while True:
+            siguiente = next(self.palabras._rango_registros(desde, (prefijo + MAXIMO_TEXTO,)), None)
+            if siguiente is None:
+                return
+            (palabra, _), _ = siguiente
+            yield palabra
+            desde = (palabra, MAXIMO_ID)  # Saltar los demás proveedores de la misma palabra
 
-    def _obtener_altura(self, nodo):
-        """Obtiene la altura del árbol"""
-        if nodo.es_hoja:
-            return 1
+    def ids_con_prefijo(self, prefijo, exacta=False):
+        """Generador de IDs con una palabra que empieza con el prefijo (o igual a él), en orden de palabra y luego de ID"""
+        hasta = (prefijo, MAXIMO_ID) if exacta else (prefijo + MAXIMO_TEXTO,)
+        for (_, clave), _ in self.palabras._rango_registros((prefijo,), hasta):
+            yield clave
 
-        if nodo.hijos:
-            return 1 + self._obtener_altura(nodo.hijos[0])
-        return 1
\ No newline at end of file
+    def similares(self, palabra):
+        """Palabras del vocabulario con trigramas en común: pares (palabra, similitud de Jaccard) de mayor a menor"""
+        propios = trigramas(palabra)
+        comunes = {}
+        for trigrama in propios:
+            for (_, otra), _ in self.trigramas._rango_registros((trigrama,), (trigrama, MAXIMO_TEXTO)):
+                comunes[otra] = comunes.get(otra, 0) + 1
+        puntajes = []
+        for otra, cantidad in comunes.items():
+            similitud = cantidad / (len(propios) + len(trigramas(otra)) - cantidad)
+            if similitud >= UMBRAL_SIMILITUD and otra != palabra:
+                puntajes.append((otra, round(similitud, 3)))
+        return heapq.nlargest(MAXIMO_SIMILARES, puntajes, key=lambda par: par[1])
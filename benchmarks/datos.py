@@ -0,0 +1,26 @@
+import random
+
+# Vocabulario de los proveedores sintéticos: pocos servicios y ubicaciones distintos, como en producción
+SERVICIOS = ('plomería', 'electricidad', 'carpintería', 'pintura', 'jardinería', 'limpieza', 'cerrajería',
+             'albañilería', 'mecánica', 'fumigación', 'mudanzas', 'tapicería')
+UBICACIONES = ('Guatemala', 'Mixco', 'Villa Nueva', 'Petapa', 'Amatitlán', 'Antigua Guatemala', 'Chimaltenango',
+               'Escuintla', 'Quetzaltenango', 'Cobán', 'Huehuetenango', 'Zacapa', 'Jutiapa', 'Retalhuleu')
+NOMBRES = ('Servicios', 'Soluciones', 'Taller', 'Grupo', 'Hermanos', 'Técnica', 'Express', 'Profesional')
+APELLIDOS = ('García', 'López', 'Pérez', 'Hernández', 'Morales', 'Castillo', 'Ramírez', 'Juárez', 'Méndez',
+             'Barrios', 'Cifuentes', 'Yax', 'Puác', 'Chávez', 'Ortiz', 'Reyes')
+
+
+def generar_proveedores(cantidad, semilla=0):
+    """Genera 'cantidad' proveedores sintéticos reproducibles (misma semilla, mismos datos) con IDs en desorden"""
+    aleatorio = random.Random(semilla)
+    ids = list(range(1, cantidad + 1))
+    aleatorio.shuffle(ids)
+    for id_proveedor in ids:
+        yield {
+            'id': id_proveedor,
+            'nombre': f'{aleatorio.choice(NOMBRES)} {aleatorio.choice(APELLIDOS)} {id_proveedor}',
+            # Copias nuevas del texto, como llegarían desde JSON
+            'servicio': ''.join(aleatorio.choice(SERVICIOS)),
+            'calificacion': round(aleatorio.uniform(1, 5), 1),
+            'ubicacion': ''.join(aleatorio.choice(UBICACIONES))
+        }
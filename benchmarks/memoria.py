@@ -0,0 +1,46 @@
+"""Compara los bytes por proveedor del árbol B guardando diccionarios frente al modo compacto.
+
+Uso: python -m benchmarks.memoria --proveedores 100000 --grado 3
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+from arbol_b import ArbolB
+from benchmarks.datos import generar_proveedores
+
+
+def medir(cantidad, grado, compacto):
+    """Construye un árbol con 'cantidad' proveedores y devuelve los bytes que retiene (índices incluidos)"""
+    gc.collect()
+    tracemalloc.start()
+    inicio = tracemalloc.get_traced_memory()[0]
+
+    arbol = ArbolB(grado=grado, compacto=compacto)
+    for datos in generar_proveedores(cantidad):
+        arbol.insertar(datos['id'], datos)
+
+    gc.collect()
+    retenidos = tracemalloc.get_traced_memory()[0] - inicio
+    tracemalloc.stop()
+    del arbol
+    return retenidos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--proveedores', type=int, default=100000)
+    parser.add_argument('--grado', type=int, default=3)
+    args = parser.parse_args()
+
+    resultado = {'proveedores': args.proveedores, 'grado': args.grado}
+    for modo, compacto in (('diccionarios', False), ('compacto', True)):
+        retenidos = medir(args.proveedores, args.grado, compacto)
+        resultado[modo] = {'bytes': retenidos, 'bytes_por_proveedor': round(retenidos / args.proveedores, 1)}
+    resultado['reduccion'] = round(1 - resultado['compacto']['bytes'] / resultado['diccionarios']['bytes'], 3)
+    print(json.dumps(resultado, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""Mide el rendimiento del árbol B y de la API con datos sintéticos reproducibles y guarda los resultados en JSON.
+
+Uso: python -m benchmarks.rendimiento --escalas 1000 10000 100000 --grados 3 16 32 --salida base.json
+     python -m benchmarks.rendimiento --salida actual.json --comparar base.json --tolerancia 0.15
+
+Con --comparar se imprime la razón actual/base de cada medición y el proceso termina con código 1 si alguna
+empeoró más que la tolerancia, para usarlo como verificación antes de publicar cambios en arbol_b.py.
+"""
+import argparse
+import gc
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from statistics import mean
+
+from arbol_b import ArbolB, ORDENES
+from benchmarks.datos import SERVICIOS, UBICACIONES, generar_proveedores
+
+VERSION_FORMATO = 1
+# Métrica que se compara entre ejecuciones: mediana de latencia, u operaciones por segundo en las de rendimiento
+METRICA_LATENCIA = 'p50_us'
+METRICA_RENDIMIENTO = 'operaciones_por_segundo'
+
+
+def resumir(duraciones_ns):
+    """Resume una lista de duraciones en nanosegundos: percentiles y media en microsegundos"""
+    ordenadas = sorted(duraciones_ns)
+    cantidad = len(ordenadas)
+
+    def percentil(p):
+        return round(ordenadas[min(cantidad - 1, int(p * cantidad))] / 1000, 2)
+
+    return {
+        'muestras': cantidad,
+        'p50_us': percentil(0.50),
+        'p95_us': percentil(0.95),
+        'p99_us': percentil(0.99),
+        'maximo_us': round(ordenadas[-1] / 1000, 2),
+        'media_us': round(mean(ordenadas) / 1000, 2)
+    }
+
+
+def medir_latencia(operacion, argumentos, repeticiones=1):
+    """Ejecuta 'operacion' con cada argumento 'repeticiones' veces y resume todas las latencias, sin el recolector de basura"""
+    duraciones = []
+    reloj = time.perf_counter_ns
+    for _ in range(repeticiones):
+        gc.collect()
+        gc.disable()
+        try:
+            for argumento in argumentos:
+                inicio = reloj()
+                operacion(argumento)
+                duraciones.append(reloj() - inicio)
+        finally:
+            gc.enable()
+    return resumir(duraciones)
+
+
+def medir_rendimiento(operacion, cantidad, repeticiones=1):
+    """Ejecuta 'operacion' 'repeticiones' veces y devuelve las operaciones por segundo de la más rápida"""
+    mejor = None
+    for _ in range(repeticiones):
+        gc.collect()
+        inicio = time.perf_counter()
+        operacion()
+        segundos = time.perf_counter() - inicio
+        mejor = segundos if mejor is None else min(mejor, segundos)
+    return {'muestras': cantidad, 'segundos': round(mejor, 4),
+            METRICA_RENDIMIENTO: round(cantidad / mejor, 1)}
+
+
+def medir_arbol(escala, grado, consultas, consultas_pesadas, semilla, repeticiones):
+    """Mediciones directas sobre ArbolB; devuelve el árbol construido y la lista de resultados"""
+    resultados = []
+
+    def agregar(operacion, medicion):
+        resultados.append(dict(capa='arbol', operacion=operacion, escala=escala, grado=grado, **medicion))
+
+    def medir(operacion, argumentos):
+        return medir_latencia(operacion, argumentos, repeticiones)
+
+    construidos = []  # El último árbol construido por inserciones es el que se consulta
+
+    def insertar_todos():
+        construidos[:] = [ArbolB(grado=grado)]
+        for datos in generar_proveedores(escala, semilla):
+            construidos[0].insertar(datos['id'], datos)
+
+    agregar('insercion', medir_rendimiento(insertar_todos, escala, repeticiones))
+    arbol = construidos[0]
+
+    def cargar_todos():
+        ArbolB(grado=grado).cargar_masivo((datos['id'], datos) for datos in generar_proveedores(escala, semilla))
+
+    agregar('carga_masiva', medir_rendimiento(cargar_todos, escala, repeticiones))
+
+    # Argumentos de consulta derivados de la semilla: las mismas consultas en cada ejecución
+    aleatorio = random.Random(semilla)
+    ids = [aleatorio.randint(1, escala) for _ in range(consultas)]
+    ausentes = [escala + aleatorio.randint(1, escala) for _ in range(consultas)]
+    servicios = [aleatorio.choice(SERVICIOS) for _ in range(consultas_pesadas)]
+    ubicaciones = [aleatorio.choice(UBICACIONES) for _ in range(consultas_pesadas)]
+    desplazamientos = [aleatorio.randrange(escala) for _ in range(consultas)]
+
+    agregar('buscar', medir(arbol.buscar, ids))
+    agregar('buscar_ausente', medir(arbol.buscar, ausentes))
+    agregar('buscar_por_servicio', medir(arbol.buscar_por_servicio, servicios))
+    agregar('buscar_por_ubicacion', medir(arbol.buscar_por_ubicacion, ubicaciones))
+    for orden in ORDENES:
+        agregar(f'listado_ordenado.{orden}', medir(arbol.obtener_todos_ordenados, [orden] * consultas_pesadas))
+        agregar(f'pagina_ordenada.{orden}',
+                medir(lambda desplazamiento: arbol.obtener_pagina_ordenada(orden, desplazamiento, 50),
+                      desplazamientos))
+    agregar('estadisticas', medir(lambda _: (arbol.obtener_estadisticas(),
+                                             arbol.obtener_distribucion('servicio'),
+                                             arbol.obtener_distribucion('ubicacion')),
+                                  range(consultas)))
+    return arbol, resultados
+
+
+def medir_http(arbol, escala, grado, consultas, consultas_pesadas, semilla, repeticiones):
+    """Latencia de extremo a extremo de los endpoints con el cliente de pruebas de Flask sobre 'arbol'"""
+    import app as aplicacion  # Importación diferida: solo se necesita Flask si se miden los endpoints
+
+    # Los endpoints leen las variables globales del módulo en cada petición
+    aplicacion.arbol_servicios = arbol
+    aplicacion.persistencia = None
+    cliente = aplicacion.app.test_client()
+
+    aleatorio = random.Random(semilla + 1)
+    resultados = []
+
+    def agregar(operacion, urls):
+        def pedir(url):
+            respuesta = cliente.get(url)
+            if respuesta.status_code != 200:
+                raise RuntimeError(f'{url} respondió {respuesta.status_code}')
+        resultados.append(dict(capa='http', operacion=operacion, escala=escala, grado=grado,
+                               **medir_latencia(pedir, urls, repeticiones)))
+
+    agregar('GET /api/buscar_id', [f'/api/buscar_id/{aleatorio.randint(1, escala)}' for _ in range(consultas)])
+    agregar('GET /api/buscar', [f'/api/buscar/{aleatorio.choice(SERVICIOS)}' for _ in range(consultas_pesadas)])
+    agregar('GET /api/buscar_ubicacion',
+            [f'/api/buscar_ubicacion/{aleatorio.choice(UBICACIONES)}' for _ in range(consultas_pesadas)])
+    agregar('GET /api/proveedores?after_id',
+            [f'/api/proveedores?after_id={aleatorio.randrange(escala)}' for _ in range(consultas)])
+    agregar('GET /api/proveedores?orden&offset',
+            [f'/api/proveedores?orden={aleatorio.choice(ORDENES)}&offset={aleatorio.randrange(escala)}'
+             for _ in range(consultas)])
+    agregar('GET /api/estadisticas', ['/api/estadisticas'] * consultas)
+
+    # Inserciones con IDs nuevos, después del último generado
+    siguientes = iter(range(escala + 1, escala + consultas * repeticiones + 1))
+
+    def publicar(_):
+        id_proveedor = next(siguientes)
+        respuesta = cliente.post('/api/proveedores', json={
+            'id': id_proveedor, 'nombre': f'Proveedor {id_proveedor}', 'servicio': aleatorio.choice(SERVICIOS),
+            'calificacion': 4, 'ubicacion': aleatorio.choice(UBICACIONES)})
+        if respuesta.status_code != 201:
+            raise RuntimeError(f'POST /api/proveedores respondió {respuesta.status_code}')
+
+    resultados.append(dict(capa='http', operacion='POST /api/proveedores', escala=escala, grado=grado,
+                           **medir_latencia(publicar, range(consultas), repeticiones)))
+    return resultados
+
+
+def entorno():
+    """Datos de la máquina y del código medidos, para saber si dos ejecuciones son comparables"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'fecha': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'implementacion': platform.python_implementation(),
+        'plataforma': platform.platform(),
+        'procesador': platform.processor() or platform.machine()
+    }
+
+
+def clave(resultado):
+    """Identifica una medición para emparejarla entre ejecuciones"""
+    return resultado['capa'], resultado['operacion'], resultado['escala'], resultado['grado']
+
+
+def comparar(actual, base, tolerancia):
+    """Compara dos ejecuciones; devuelve las filas (clave, metrica, base, actual, razón) y las regresiones"""
+    anteriores = {clave(resultado): resultado for resultado in base['resultados']}
+    filas, regresiones = [], []
+    for resultado in actual['resultados']:
+        anterior = anteriores.get(clave(resultado))
+        if anterior is None:
+            continue
+        if METRICA_RENDIMIENTO in resultado:
+            metrica = METRICA_RENDIMIENTO
+            razon = anterior[metrica] / resultado[metrica]  # Menos operaciones por segundo = razón mayor a 1
+        else:
+            metrica = METRICA_LATENCIA
+            razon = resultado[metrica] / anterior[metrica] if anterior[metrica] else 1.0
+        fila = (clave(resultado), metrica, anterior[metrica], resultado[metrica], round(razon, 3))
+        filas.append(fila)
+        if razon > 1 + tolerancia:
+            regresiones.append(fila)
+    return filas, regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--escalas', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Cantidades de proveedores (de 10^3 a 10^7)')
+    parser.add_argument('--grados', type=int, nargs='+', default=[3, 16, 32, 64])
+    parser.add_argument('--consultas', type=int, default=1000, help='Consultas por medición puntual')
+    parser.add_argument('--consultas-pesadas', type=int, default=10,
+                        help='Consultas por medición que devuelve muchos proveedores (búsquedas y listados)')
+    parser.add_argument('--repeticiones', type=int, default=3,
+                        help='Pasadas por medición: se toma la más rápida o se juntan todas las latencias')
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--sin-http', action='store_true', help='No medir los endpoints de Flask')
+    parser.add_argument('--salida', help='Archivo JSON con los resultados (por defecto, la salida estándar)')
+    parser.add_argument('--comparar', help='Resultados JSON de una ejecución anterior')
+    parser.add_argument('--tolerancia', type=float, default=0.10,
+                        help='Empeoramiento relativo aceptado antes de reportar una regresión')
+    args = parser.parse_args()
+
+    ejecucion = {
+        'version': VERSION_FORMATO,
+        'entorno': entorno(),
+        'parametros': {'escalas': args.escalas, 'grados': args.grados, 'consultas': args.consultas,
+                       'consultas_pesadas': args.consultas_pesadas, 'repeticiones': args.repeticiones,
+                       'semilla': args.semilla},
+        'resultados': []
+    }
+    for escala in args.escalas:
+        for grado in args.grados:
+            print(f'escala={escala} grado={grado}', file=sys.stderr)
+            arbol, resultados = medir_arbol(escala, grado, args.consultas, args.consultas_pesadas, args.semilla,
+                                            args.repeticiones)
+            ejecucion['resultados'].extend(resultados)
+            if not args.sin_http:
+                ejecucion['resultados'].extend(
+                    medir_http(arbol, escala, grado, args.consultas, args.consultas_pesadas, args.semilla,
+                               args.repeticiones))
+            del arbol
+
+    texto = json.dumps(ejecucion, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            archivo.write(texto + '\n')
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            base = json.load(archivo)
+        filas, regresiones = comparar(ejecucion, base, args.tolerancia)
+        for (capa, operacion, escala, grado), metrica, anterior, actual, razon in filas:
+            marca = '  REGRESIÓN' if razon > 1 + args.tolerancia else ''
+            print(f'{capa:5} {operacion:36} n={escala:<9} t={grado:<3} {metrica:24} '
+                  f'{anterior:>12} -> {actual:>12}  x{razon}{marca}', file=sys.stderr)
+        if regresiones:
+            print(f'{len(regresiones)} regresiones por encima de {args.tolerancia:.0%}', file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+
+
+class CacheRespuestas:
+    """Caché LRU de respuestas ya serializadas, acotada por cantidad de entradas y por bytes"""
+
+    def __init__(self, capacidad=256, maximo_bytes=64 * 1024 * 1024):
+        self.capacidad = capacidad  # Entradas como máximo
+        self.maximo_bytes = maximo_bytes  # Bytes de cuerpos como máximo
+        self.entradas = OrderedDict()  # clave -> (cuerpo, tipo, etag), de la menos a la más recientemente usada
+        self.bytes = 0
+        self.cerrojo = threading.Lock()  # Solo para guardar: las lecturas no lo toman
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave):
+        """Devuelve la entrada guardada o None; la marca como recién usada"""
+        entrada = self.entradas.get(clave)
+        if entrada is None:
+            self.fallos += 1
+            return None
+        try:
+            self.entradas.move_to_end(clave)
+        except KeyError:
+            pass  # Se descartó entre ambas operaciones: igual se puede responder con ella
+        self.aciertos += 1
+        return entrada
+
+    def guardar(self, clave, cuerpo, tipo, etag):
+        """Guarda una respuesta y descarta las menos usadas hasta volver a los límites"""
+        if self.capacidad <= 0 or len(cuerpo) > self.maximo_bytes:
+            return
+        with self.cerrojo:
+            anterior = self.entradas.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= len(anterior[0])
+            self.entradas[clave] = (cuerpo, tipo, etag)
+            self.bytes += len(cuerpo)
+            while len(self.entradas) > self.capacidad or self.bytes > self.maximo_bytes:
+                _, (descartado, _, _) = self.entradas.popitem(last=False)
+                self.bytes -= len(descartado)
+
+    def vaciar(self):
+        """Descarta todas las respuestas guardadas"""
+        with self.cerrojo:
+            self.entradas.clear()
+            self.bytes = 0
@@ -0,0 +1,146 @@
+import cProfile
+import io
+import pstats
+import random
+import threading
+from bisect import bisect_left
+
+# Límites superiores (segundos) de los intervalos de los histogramas: 1-2,5-5 por década, de 50 µs a 10 s
+LIMITES_LATENCIA = tuple(base * 10 ** exponente for exponente in range(-5, 1) for base in (1, 2.5, 5))[2:] + (10,)
+# Funciones que se muestran en el reporte de perfiles, por tiempo acumulado
+FUNCIONES_EN_REPORTE = 30
+
+
+class HistogramaLatencias:
+    """Histograma de latencias con intervalos fijos: registrar cuesta una búsqueda binaria y dos sumas"""
+
+    def __init__(self):
+        self.cuentas = [0] * (len(LIMITES_LATENCIA) + 1)  # El último intervalo es el de más de 10 s
+        self.cantidad = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+
+    def registrar(self, segundos):
+        self.cuentas[bisect_left(LIMITES_LATENCIA, segundos)] += 1
+        self.cantidad += 1
+        self.suma += segundos
+        if segundos > self.maximo:
+            self.maximo = segundos
+
+    def percentil(self, fraccion):
+        """Latencia bajo la que queda la fracción dada de las peticiones, interpolando dentro del intervalo"""
+        if not self.cantidad:
+            return 0.0
+        objetivo = fraccion * self.cantidad
+        acumuladas = 0
+        for i, cuenta in enumerate(self.cuentas):
+            if cuenta and acumuladas + cuenta >= objetivo:
+                inferior = LIMITES_LATENCIA[i - 1] if i else 0.0
+                superior = LIMITES_LATENCIA[i] if i < len(LIMITES_LATENCIA) else self.maximo
+                return min(self.maximo, inferior + (superior - inferior) * (objetivo - acumuladas) / cuenta)
+            acumuladas += cuenta
+        return self.maximo
+
+    def resumen(self):
+        """Cantidad y latencias en milisegundos"""
+        return {
+            'cantidad': self.cantidad,
+            'p50_ms': round(self.percentil(0.50) * 1000, 3),
+            'p95_ms': round(self.percentil(0.95) * 1000, 3),
+            'p99_ms': round(self.percentil(0.99) * 1000, 3),
+            'promedio_ms': round(self.suma / self.cantidad * 1000, 3) if self.cantidad else 0.0,
+            'maximo_ms': round(self.maximo * 1000, 3)
+        }
+
+
+def _etiquetas(etiquetas):
+    """Etiquetas en el formato de texto de Prometheus, con comillas y barras escapadas"""
+    pares = []
+    for nombre, valor in etiquetas.items():
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pares.append(f'{nombre}="{valor}"')
+    return '{' + ','.join(pares) + '}'
+
+
+class RegistroMetricas:
+    """Histogramas de latencia por endpoint; exporta en JSON o en el formato de texto de Prometheus"""
+
+    def __init__(self):
+        self.histogramas = {}  # endpoint -> HistogramaLatencias
+        self.cerrojo = threading.Lock()  # Las peticiones terminan en varios hilos a la vez
+
+    def registrar(self, endpoint, segundos):
+        with self.cerrojo:
+            histograma = self.histogramas.get(endpoint)
+            if histograma is None:
+                histograma = self.histogramas[endpoint] = HistogramaLatencias()
+            histograma.registrar(segundos)
+
+    def resumen(self):
+        """Percentiles por endpoint"""
+        with self.cerrojo:
+            return {endpoint: histograma.resumen() for endpoint, histograma in sorted(self.histogramas.items())}
+
+    def prometheus(self, series=()):
+        """Texto para Prometheus: los histogramas de latencia y las series (nombre, tipo, ayuda, [(etiquetas, valor)])"""
+        lineas = ['# HELP arbol_peticion_segundos Latencia de las peticiones por endpoint',
+                  '# TYPE arbol_peticion_segundos histogram']
+        with self.cerrojo:
+            for endpoint, histograma in sorted(self.histogramas.items()):
+                acumuladas = 0
+                for limite, cuenta in zip(LIMITES_LATENCIA + ('+Inf',), histograma.cuentas):
+                    acumuladas += cuenta
+                    etiquetas = _etiquetas({'endpoint': endpoint, 'le': limite})
+                    lineas.append(f'arbol_peticion_segundos_bucket{etiquetas} {acumuladas}')
+                etiquetas = _etiquetas({'endpoint': endpoint})
+                lineas.append(f'arbol_peticion_segundos_sum{etiquetas} {histograma.suma}')
+                lineas.append(f'arbol_peticion_segundos_count{etiquetas} {histograma.cantidad}')
+
+        for nombre, tipo, ayuda, valores in series:
+            lineas.append(f'# HELP {nombre} {ayuda}')
+            lineas.append(f'# TYPE {nombre} {tipo}')
+            for etiquetas, valor in valores:
+                lineas.append(f'{nombre}{_etiquetas(etiquetas)} {valor}')
+        return '\n'.join(lineas) + '\n'
+
+
+class MuestreoPerfiles:
+    """Perfila con cProfile una fracción de las peticiones (una a la vez) y acumula sus estadísticas"""
+
+    def __init__(self, fraccion=0.0):
+        self.fraccion = fraccion  # 0 lo desactiva; 1 perfila todas las peticiones que no se solapen
+        self.en_curso = threading.Lock()  # Un solo perfil activo: cProfile no admite perfiles superpuestos
+        self.cerrojo = threading.Lock()  # Protege las estadísticas acumuladas
+        self.estadisticas = None
+        self.muestras = 0
+
+    def iniciar(self):
+        """Empieza a perfilar la petición actual si sale sorteada; devuelve el perfil o None"""
+        if self.fraccion <= 0 or random.random() >= self.fraccion:
+            return None
+        if not self.en_curso.acquire(blocking=False):
+            return None  # Hay otra petición perfilándose: esta se omite
+        perfil = cProfile.Profile()
+        perfil.enable()
+        return perfil
+
+    def terminar(self, perfil):
+        """Detiene el perfil y suma sus estadísticas a las acumuladas"""
+        perfil.disable()
+        self.en_curso.release()
+        with self.cerrojo:
+            if self.estadisticas is None:
+                self.estadisticas = pstats.Stats(perfil)
+            else:
+                self.estadisticas.add(perfil)
+            self.muestras += 1
+
+    def reporte(self):
+        """Funciones con más tiempo acumulado en las peticiones perfiladas, como texto de pstats"""
+        salida = io.StringIO()
+        with self.cerrojo:
+            salida.write(f'Peticiones perfiladas: {self.muestras}\n')
+            if self.estadisticas is not None:
+                self.estadisticas.stream = salida
+                self.estadisticas.sort_stats('cumulative').print_stats(FUNCIONES_EN_REPORTE)
+        return salida.getvalue()
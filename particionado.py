@@ -0,0 +1,316 @@
+import heapq
+import multiprocessing
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from itertools import islice
+from operator import itemgetter
+
+from arbol_b import ArbolB, ORDENES, clave_coincidencia
+
+# Registros por mensaje al recorrer una partición: acota la memoria y la latencia de cada ida y vuelta
+REGISTROS_POR_BLOQUE = 1000
+# fork: los procesos hijos no vuelven a importar el módulo principal (app.py crea el árbol al importarse)
+CONTEXTO = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+
+
+def _trabajador(conexion, grado):
+    """Bucle del proceso de una partición: aplica a su árbol las operaciones que llegan por la conexión"""
+    arbol = ArbolB(grado)
+    cursores = {}  # Recorridos abiertos por el proceso principal: número -> iterador de la instantánea
+    siguiente = 0
+    while True:
+        mensaje = conexion.recv()
+        if mensaje is None:
+            break
+        operacion, argumentos = mensaje
+        try:
+            if operacion == 'escribir':
+                metodo, parametros = argumentos
+                resultado = getattr(arbol, metodo)(*parametros)
+            elif operacion == 'leer':
+                metodo, parametros = argumentos
+                resultado = getattr(arbol.instantanea(), metodo)(*parametros)
+            elif operacion == 'abrir':
+                # Recorrido en bloques sobre una sola versión; con orden, cada elemento va con su clave de orden
+                metodo, parametros, orden, tamano = argumentos
+                instantanea = arbol.instantanea()
+                recorrido = iter(getattr(instantanea, metodo)(*parametros))
+                if orden is not None:
+                    clave = instantanea.clave_orden(orden)
+                    recorrido = ((clave(datos), datos) for datos in recorrido)
+                bloque = list(islice(recorrido, tamano))
+                if len(bloque) < tamano:
+                    resultado = None, bloque  # Terminó en el primer bloque: no queda cursor abierto
+                else:
+                    siguiente += 1
+                    cursores[siguiente] = recorrido
+                    resultado = siguiente, bloque
+            elif operacion == 'siguiente':
+                cursor, tamano = argumentos
+                resultado = list(islice(cursores[cursor], tamano))
+                if len(resultado) < tamano:
+                    del cursores[cursor]
+            elif operacion == 'cerrar':
+                cursores.pop(argumentos, None)
+                resultado = None
+            else:
+                raise ValueError(f"Operación desconocida en la partición: {operacion}")
+        except Exception as error:
+            conexion.send((False, error))
+        else:
+            conexion.send((True, resultado))
+    conexion.close()
+
+
+class ArbolParticionado:
+    """Reparte los proveedores por hash del ID entre árboles B en procesos separados y consulta a todos en paralelo"""
+
+    def __init__(self, particiones=None, grado=3):
+        self.particiones = particiones or os.cpu_count()
+        self.grado = grado
+        self.almacenamiento = None  # Las particiones viven en memoria: la durabilidad es del WAL y sus instantáneas
+        self.modificaciones = 0  # Cambia con cada escritura: sirve de versión para cachear respuestas
+        self.cerrojo = threading.Lock()  # Protege el contador de modificaciones
+        self.conexiones = []
+        self.procesos = []
+        self.cerrojos = []  # Uno por partición: un pedido y su respuesta no se intercalan con los de otro hilo
+        for _ in range(self.particiones):
+            conexion, remota = CONTEXTO.Pipe()
+            proceso = CONTEXTO.Process(target=_trabajador, args=(remota, grado), daemon=True)
+            proceso.start()
+            remota.close()
+            self.conexiones.append(conexion)
+            self.procesos.append(proceso)
+            self.cerrojos.append(threading.Lock())
+
+    def particion(self, clave):
+        """Partición a la que pertenece un ID"""
+        return hash(clave) % self.particiones
+
+    @contextmanager
+    def _bloqueadas(self, particiones):
+        """Toma los cerrojos de las particiones; siempre en orden, así dos hilos no pueden bloquearse entre sí"""
+        particiones = sorted(set(particiones))
+        for particion in particiones:
+            self.cerrojos[particion].acquire()
+        try:
+            yield
+        finally:
+            for particion in particiones:
+                self.cerrojos[particion].release()
+
+    def _intercambiar(self, pedidos):
+        """Con los cerrojos tomados, envía a la vez los pedidos y devuelve los pares (correcto, resultado) en orden"""
+        for particion, operacion, argumentos in pedidos:
+            self.conexiones[particion].send((operacion, argumentos))
+        # Las particiones trabajan en paralelo mientras se esperan las respuestas una por una
+        return [self.conexiones[particion].recv() for particion, _, _ in pedidos]
+
+    @staticmethod
+    def _resultados(respuestas):
+        """Resultados de las respuestas; lanza el error de la primera partición que falló"""
+        for correcto, resultado in respuestas:
+            if not correcto:
+                raise resultado
+        return [resultado for _, resultado in respuestas]
+
+    def _repartir(self, pedidos):
+        """Envía a la vez los pedidos (partición, operación, argumentos) y devuelve las respuestas en el mismo orden"""
+        with self._bloqueadas(particion for particion, _, _ in pedidos):
+            respuestas = self._intercambiar(pedidos)
+        return self._resultados(respuestas)
+
+    def _en_todas(self, operacion, argumentos):
+        """Envía la misma operación a todas las particiones y devuelve sus respuestas"""
+        return self._repartir([(particion, operacion, argumentos) for particion in range(self.particiones)])
+
+    def _leer_en_todas(self, metodo, *parametros):
+        """Ejecuta un método de lectura en la instantánea de cada partición"""
+        return self._en_todas('leer', (metodo, parametros))
+
+    def _recorridos(self, metodo, parametros, orden=None, tamano=REGISTROS_POR_BLOQUE):
+        """Abre a la vez un recorrido por partición y devuelve sus generadores, que piden los bloques siguientes"""
+        abiertos = self._en_todas('abrir', (metodo, parametros, orden, tamano))
+        return [self._recorrido(particion, cursor, bloque)
+                for particion, (cursor, bloque) in enumerate(abiertos)]
+
+    def _recorrido(self, particion, cursor, bloque):
+        """Generador de los elementos de un recorrido abierto en una partición"""
+        try:
+            while True:
+                yield from bloque
+                if cursor is None:
+                    return
+                (bloque,) = self._repartir([(particion, 'siguiente', (cursor, REGISTROS_POR_BLOQUE))])
+                if len(bloque) < REGISTROS_POR_BLOQUE:
+                    cursor = None  # La partición ya lo cerró
+        finally:
+            if cursor is not None:
+                # Recorrido abandonado (p. ej. el cliente cortó el envío): liberar el iterador de la partición
+                self._repartir([(particion, 'cerrar', cursor)])
+
+    def _ordenados(self, metodo, parametros, orden, tamano=REGISTROS_POR_BLOQUE):
+        """Mezcla en k vías los recorridos ordenados de las particiones"""
+        recorridos = self._recorridos(metodo, parametros, orden, tamano)
+        return map(itemgetter(1), heapq.merge(*recorridos, key=itemgetter(0)))
+
+    def _modificado(self):
+        with self.cerrojo:
+            self.modificaciones += 1
+
+    def __len__(self):
+        return sum(self._leer_en_todas('__len__'))
+
+    def instantanea(self):
+        """Cada lectura usa la instantánea de cada partición; entre particiones no hay una versión común"""
+        return self
+
+    def sincronizar(self, **adicionales):
+        """Las particiones viven en memoria: no hay páginas que bajar a disco"""
+
+    def insertar(self, clave, datos):
+        """Inserta en la partición del ID"""
+        self._repartir([(self.particion(clave), 'escribir', ('insertar', (clave, datos)))])
+        self._modificado()
+
+    def cargar_masivo(self, registros):
+        """Divide el lote por partición y lo carga en todas a la vez; si una rechaza su parte, ninguna carga nada"""
+        lotes = [[] for _ in range(self.particiones)]
+        for clave, datos in registros:
+            lotes[self.particion(clave)].append((clave, datos))
+        partes = [(particion, (lote,)) for particion, lote in enumerate(lotes) if lote]
+        with self._bloqueadas(particion for particion, _ in partes):
+            # Primero todas verifican su parte; con los cerrojos tomados nadie escribe entre ambas vueltas
+            self._resultados(self._intercambiar([(particion, 'leer', ('verificar_lote', parte))
+                                                 for particion, parte in partes]))
+            try:
+                respuestas = self._intercambiar([(particion, 'escribir', ('cargar_masivo', parte))
+                                                 for particion, parte in partes])
+            finally:
+                self._modificado()
+        self._resultados(respuestas)
+
+    def eliminar(self, clave):
+        """Elimina en la partición del ID; devuelve los datos eliminados o None"""
+        (datos,) = self._repartir([(self.particion(clave), 'escribir', ('eliminar', (clave,)))])
+        if datos is not None:
+            self._modificado()
+        return datos
+
+    def actualizar(self, clave, cambios):
+        """Cambia campos en la partición del ID; devuelve los datos nuevos o None"""
+        (datos,) = self._repartir([(self.particion(clave), 'escribir', ('actualizar', (clave, cambios)))])
+        if datos is not None:
+            self._modificado()
+        return datos
+
+    def buscar(self, clave):
+        """Busca en la partición del ID"""
+        (datos,) = self._repartir([(self.particion(clave), 'leer', ('buscar', (clave,)))])
+        return datos
+
+    def rango(self, desde=None, hasta=None):
+        """Generador de pares (clave, datos) entre desde y hasta, mezclando las particiones en orden de ID"""
+        return heapq.merge(*self._recorridos('rango', (desde, hasta)), key=itemgetter(0))
+
+    def iterar_por(self, campo, valor):
+        """Generador de los proveedores con el valor dado en un campo indexado, en orden de ID"""
+        return self._ordenados('iterar_por', (campo, valor), 'id')
+
+    def contar_por(self, campo, valor):
+        """Cantidad de proveedores con el valor dado, sumando los conteos de las particiones"""
+        return sum(self._leer_en_todas('contar_por', campo, valor))
+
+    def buscar_por_servicio(self, tipo_servicio):
+        """Busca todos los proveedores de un tipo de servicio específico"""
+        return list(self.iterar_por('servicio', tipo_servicio))
+
+    def buscar_por_ubicacion(self, ubicacion):
+        """Busca todos los proveedores de una ubicación específica"""
+        return list(self.iterar_por('ubicacion', ubicacion))
+
+    def buscar_nombre(self, texto, limite=10, aproximada=True):
+        """Busca por nombre en todas las particiones y se queda con los 'limite' mejores"""
+        listas = self._leer_en_todas('buscar_nombre', texto, limite, aproximada)
+        return list(islice(heapq.merge(*listas, key=clave_coincidencia), limite))
+
+    def obtener_todos_ordenados(self, orden_por='nombre'):
+        """Obtiene todos los proveedores ordenados por el campo especificado"""
+        return list(self.iterar_ordenados(orden_por))
+
+    def iterar_ordenados(self, orden_por='nombre', desplazamiento=0, tamano=REGISTROS_POR_BLOQUE):
+        """Generador de los proveedores ordenados desde una posición; saltarla recorre 'desplazamiento' proveedores"""
+        orden = orden_por if orden_por in ORDENES else 'id'
+        # Cada partición tiene su parte de la posición pedida, pero no se sabe cuánta: se mezcla desde el inicio
+        return islice(self._ordenados('iterar_ordenados', (orden,), orden, tamano), desplazamiento, None)
+
+    def obtener_pagina_ordenada(self, orden_por, desplazamiento=0, limite=None):
+        """Obtiene una página del listado ordenado; cada partición envía como mucho lo que cabe hasta el final de la página"""
+        if orden_por not in ORDENES:
+            raise ValueError(f"Orden no soportado: {orden_por}")
+        tamano = REGISTROS_POR_BLOQUE if limite is None else min(REGISTROS_POR_BLOQUE, desplazamiento + limite)
+        return list(islice(self.iterar_ordenados(orden_por, desplazamiento, tamano), limite))
+
+    def obtener_estadisticas(self):
+        """Suma las estadísticas de las particiones; la altura es la de la partición más alta"""
+        estadisticas = self._leer_en_todas('obtener_estadisticas')
+        return {
+            'total_nodos': sum(parte['total_nodos'] for parte in estadisticas),
+            'total_proveedores': sum(parte['total_proveedores'] for parte in estadisticas),
+            'altura': max(parte['altura'] for parte in estadisticas),
+            'grado': self.grado,
+            'particiones': self.particiones
+        }
+
+    def obtener_uso(self):
+        """Suma por árbol los contadores de las particiones; la altura es la de la partición más alta"""
+        uso = {}
+        for parte in self._leer_en_todas('obtener_uso'):
+            for nombre, valores in parte.items():
+                if nombre not in uso:
+                    uso[nombre] = dict(valores)
+                    continue
+                for medida, valor in valores.items():
+                    uso[nombre][medida] = max(uso[nombre][medida], valor) if medida == 'altura' \
+                        else uso[nombre][medida] + valor
+        return uso
+
+    def obtener_distribucion(self, campo):
+        """Suma los histogramas por valor del campo de todas las particiones"""
+        distribucion = Counter()
+        for parte in self._leer_en_todas('obtener_distribucion', campo):
+            distribucion.update(parte)
+        return dict(distribucion)
+
+    def consultar(self, servicio=None, ubicacion=None, calificacion_min=None, calificacion_max=None,
+                  id_desde=None, id_hasta=None, orden='id', limite=None):
+        """Consulta combinada: todos los filtros a la vez, ordenada por 'orden' y cortada en 'limite'"""
+        return self.ejecutar_plan(self.planificar(servicio, ubicacion, calificacion_min, calificacion_max,
+                                                  id_desde, id_hasta, orden, limite))
+
+    def planificar(self, servicio=None, ubicacion=None, calificacion_min=None, calificacion_max=None,
+                   id_desde=None, id_hasta=None, orden='id', limite=None):
+        """Cada partición elige su propio camino según sus conteos"""
+        planes = self._leer_en_todas('planificar', servicio, ubicacion, calificacion_min, calificacion_max,
+                                     id_desde, id_hasta, orden, limite)
+        return {'particiones': planes, 'orden': orden, 'limite': limite}
+
+    def ejecutar_plan(self, plan):
+        """Ejecuta el plan de cada partición en paralelo y mezcla sus resultados ya ordenados hasta el límite"""
+        tamano = REGISTROS_POR_BLOQUE if plan['limite'] is None else min(REGISTROS_POR_BLOQUE, plan['limite'])
+        recorridos = self._repartir([(particion, 'abrir', ('ejecutar_plan', (plan_particion,), plan['orden'], tamano))
+                                     for particion, plan_particion in enumerate(plan['particiones'])])
+        mezcla = heapq.merge(*(self._recorrido(particion, cursor, bloque)
+                               for particion, (cursor, bloque) in enumerate(recorridos)), key=itemgetter(0))
+        return [datos for _, datos in islice(mezcla, plan['limite'])]
+
+    def cerrar(self):
+        """Detiene los procesos de las particiones"""
+        for particion, conexion in enumerate(self.conexiones):
+            with self.cerrojos[particion]:
+                conexion.send(None)
+                conexion.close()
+        for proceso in self.procesos:
+            proceso.join()
@@ -0,0 +1,293 @@
+import marshal
+import os
+import struct
+import threading
+import time
+import warnings
+import zlib
+from itertools import islice
+
+# Políticas de fsync del registro: cada operación espera a estar en disco, en lotes por intervalo, o nunca
+POLITICAS_FSYNC = ('siempre', 'lote', 'nunca')
+# Encabezado de cada entrada del registro: longitud y CRC32 de la carga
+ENCABEZADO = struct.Struct('<II')
+
+MAGICO_INSTANTANEA = b'ARBOLSN1'
+# Encabezado de la instantánea: mágico, secuencia incluida y total de proveedores
+CABECERA_INSTANTANEA = struct.Struct('<8sQQ')
+# Proveedores por bloque serializado dentro de la instantánea
+REGISTROS_POR_BLOQUE = 10000
+
+
+class RegistroEscritura:
+    """Registro de escritura anticipada (WAL) de solo anexado con fsync agrupado (group commit)"""
+
+    def __init__(self, ruta, politica_fsync='lote', intervalo_fsync=0.01):
+        if politica_fsync not in POLITICAS_FSYNC:
+            raise ValueError(f"Política de fsync no soportada: {politica_fsync}")
+        self.ruta = ruta
+        self.politica_fsync = politica_fsync
+        self.intervalo_fsync = intervalo_fsync  # Segundos máximos entre fsync con la política 'lote'
+        self.archivo = open(ruta, 'ab')
+        # Descartar una cola incompleta para que las entradas nuevas no queden detrás de basura
+        self.archivo.truncate(self._fin_valido(ruta))
+        self.condicion = threading.Condition()
+        self.escritas = 0  # Entradas escritas en el archivo
+        self.confirmadas = 0  # Entradas que ya están en disco
+        self.sincronizando = False  # Hay un hilo haciendo fsync por todo el grupo
+        self.ultimo_fsync = time.monotonic()
+        self.cerrado = False
+        self.sincronizador = None
+        if politica_fsync == 'lote':
+            # Baja a disco lo que los escritores dejaron sin fsync aunque no llegue otra escritura
+            self.sincronizador = threading.Thread(target=self._sincronizar_pendientes, name='wal-fsync', daemon=True)
+            self.sincronizador.start()
+
+    @staticmethod
+    def _entradas(ruta):
+        """Generador de (fin de la entrada, carga) para las entradas válidas; se detiene en una cola incompleta"""
+        if not os.path.exists(ruta):
+            return
+        with open(ruta, 'rb') as archivo:
+            while True:
+                encabezado = archivo.read(ENCABEZADO.size)
+                if len(encabezado) < ENCABEZADO.size:
+                    return
+                longitud, crc = ENCABEZADO.unpack(encabezado)
+                carga = archivo.read(longitud)
+                if len(carga) < longitud or zlib.crc32(carga) != crc:
+                    return  # Escritura interrumpida por una caída: lo que sigue no es confiable
+                yield archivo.tell(), carga
+
+    @staticmethod
+    def leer(ruta):
+        """Generador de las entradas (secuencia, operacion, argumentos) válidas del registro"""
+        for _, carga in RegistroEscritura._entradas(ruta):
+            yield marshal.loads(carga)
+
+    @staticmethod
+    def _fin_valido(ruta):
+        """Posición donde termina la última entrada válida"""
+        fin = 0
+        for fin, _ in RegistroEscritura._entradas(ruta):
+            pass
+        return fin
+
+    def agregar(self, secuencia, operacion, argumentos):
+        """Anexa una operación al registro; devuelve su número para confirmar su durabilidad"""
+        carga = marshal.dumps((secuencia, operacion, argumentos))
+        with self.condicion:
+            self.archivo.write(ENCABEZADO.pack(len(carga), zlib.crc32(carga)) + carga)
+            self.escritas += 1
+            return self.escritas
+
+    def confirmar(self, numero):
+        """Espera, según la política de fsync, a que la entrada 'numero' sea durable"""
+        with self.condicion:
+            if self.politica_fsync == 'nunca':
+                self.archivo.flush()
+            elif self.politica_fsync == 'lote' and time.monotonic() - self.ultimo_fsync < self.intervalo_fsync:
+                self.archivo.flush()
+                self.condicion.notify_all()  # El sincronizador le hace fsync al vencer el intervalo
+            else:
+                self._esperar_fsync(numero)
+
+    def _esperar_fsync(self, numero):
+        """Espera a que la entrada 'numero' esté en disco; un solo hilo hace fsync por todas las pendientes"""
+        while self.confirmadas < numero:
+            if self.sincronizando:
+                self.condicion.wait()
+                continue
+
+            self.sincronizando = True
+            objetivo = self.escritas
+            self.archivo.flush()
+            # Soltar el cerrojo durante el fsync para que otros escritores se sumen al siguiente grupo
+            self.condicion.release()
+            try:
+                os.fsync(self.archivo.fileno())
+            finally:
+                self.condicion.acquire()
+                self.sincronizando = False
+            self.confirmadas = max(self.confirmadas, objetivo)
+            self.ultimo_fsync = time.monotonic()
+            self.condicion.notify_all()
+
+    def _sincronizar_pendientes(self):
+        """Hilo de la política 'lote': hace fsync de las entradas pendientes cuando vence el intervalo desde el último"""
+        with self.condicion:
+            while not self.cerrado:
+                if self.confirmadas >= self.escritas:
+                    self.condicion.wait()
+                    continue
+                espera = self.ultimo_fsync + self.intervalo_fsync - time.monotonic()
+                if espera > 0:
+                    self.condicion.wait(espera)
+                else:
+                    self._esperar_fsync(self.escritas)
+
+    def truncar(self):
+        """Vacía el registro después de un punto de control"""
+        with self.condicion:
+            while self.sincronizando:
+                self.condicion.wait()  # No cerrar el archivo durante el fsync de otro hilo
+            self.archivo.close()
+            self.archivo = open(self.ruta, 'wb')
+            os.fsync(self.archivo.fileno())
+            # Lo escrito hasta ahora ya es durable por el punto de control
+            self.confirmadas = self.escritas
+            self.condicion.notify_all()
+
+    def cerrar(self):
+        """Baja a disco las entradas pendientes y cierra el archivo"""
+        with self.condicion:
+            self.cerrado = True
+            self.condicion.notify_all()
+        if self.sincronizador:
+            self.sincronizador.join()
+        with self.condicion:
+            self.archivo.flush()
+            os.fsync(self.archivo.fileno())
+            self.archivo.close()
+
+
+def guardar_instantanea(arbol, ruta, secuencia):
+    """Escribe una instantánea binaria del árbol en orden de ID, reemplazando la anterior de forma atómica"""
+    temporal = f'{ruta}.tmp'
+    with open(temporal, 'wb') as archivo:
+        archivo.write(CABECERA_INSTANTANEA.pack(MAGICO_INSTANTANEA, secuencia, len(arbol)))
+        recorrido = arbol.rango()
+        while True:
+            bloque = list(islice(recorrido, REGISTROS_POR_BLOQUE))
+            if not bloque:
+                break
+            marshal.dump(bloque, archivo)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, ruta)
+
+
+def leer_instantanea(ruta):
+    """Lee una instantánea; devuelve la secuencia que incluye y la lista de pares (id, datos)"""
+    with open(ruta, 'rb') as archivo:
+        magico, secuencia, total = CABECERA_INSTANTANEA.unpack(archivo.read(CABECERA_INSTANTANEA.size))
+        if magico != MAGICO_INSTANTANEA:
+            raise ValueError(f"{ruta} no es una instantánea de árbol B")
+        registros = []
+        while len(registros) < total:
+            registros.extend(marshal.load(archivo))
+    return secuencia, registros
+
+
+class GestorPersistencia:
+    """Hace durables las escrituras del árbol con un WAL y puntos de control periódicos para reinicios rápidos"""
+
+    def __init__(self, arbol, directorio, politica_fsync='lote', intervalo_fsync=0.01, intervalo_checkpoint=10000):
+        os.makedirs(directorio, exist_ok=True)
+        self.arbol = arbol
+        self.ruta_instantanea = os.path.join(directorio, 'proveedores.instantanea')
+        self.ruta_registro = os.path.join(directorio, 'proveedores.wal')
+        self.intervalo_checkpoint = intervalo_checkpoint  # Operaciones entre puntos de control
+        self.cerrojo = threading.Lock()  # Serializa las escrituras para que el orden del WAL sea el del árbol
+        self.omitidas = []  # (secuencia, operación, error) de las entradas del WAL que no se pudieron reaplicar
+
+        self.secuencia = self._recuperar()
+        self.pendientes = self.secuencia - self.secuencia_checkpoint  # Operaciones del WAL aún no incluidas
+        self.registro = RegistroEscritura(self.ruta_registro, politica_fsync, intervalo_fsync)
+
+    def _recuperar(self):
+        """Carga el último punto de control y reaplica la cola del WAL; devuelve la última secuencia aplicada"""
+        if self.arbol.almacenamiento:
+            # Árbol paginado: el punto de control es la última sincronización de sus páginas
+            self.secuencia_checkpoint = self.arbol.almacenamiento.metadatos.get('secuencia', 0)
+        elif os.path.exists(self.ruta_instantanea):
+            self.secuencia_checkpoint, registros = leer_instantanea(self.ruta_instantanea)
+            self.arbol.cargar_masivo(registros)
+        else:
+            self.secuencia_checkpoint = 0
+
+        secuencia = self.secuencia_checkpoint
+        for secuencia_entrada, operacion, argumentos in RegistroEscritura.leer(self.ruta_registro):
+            if secuencia_entrada > self.secuencia_checkpoint:
+                try:
+                    self._aplicar(operacion, argumentos, reaplicando=True)
+                except (TypeError, ValueError) as error:
+                    # Una entrada que el árbol rechaza (p. ej. escrita por una versión anterior que no la validaba)
+                    # se omite: el árbol no cambió y una petición inválida no puede impedir el arranque
+                    self.omitidas.append((secuencia_entrada, operacion, str(error)))
+                    warnings.warn(f"Entrada {secuencia_entrada} del WAL omitida ({operacion}): {error}")
+                secuencia = secuencia_entrada
+        return secuencia
+
+    def _aplicar(self, operacion, argumentos, reaplicando=False):
+        """Aplica una operación del WAL al árbol y devuelve su resultado; al reaplicar se omite lo que ya está en el árbol"""
+        if operacion == 'insertar':
+            clave, datos = argumentos
+            if not reaplicando or self.arbol.buscar(clave) is None:
+                self.arbol.insertar(clave, datos)
+        elif operacion == 'cargar_masivo':
+            registros = argumentos
+            if reaplicando:
+                registros = [(clave, datos) for clave, datos in registros if self.arbol.buscar(clave) is None]
+            self.arbol.cargar_masivo(registros)
+        elif operacion == 'eliminar':
+            # Idempotentes: reaplicarlas sobre un estado que ya las incluye no cambia nada
+            return self.arbol.eliminar(argumentos)
+        elif operacion == 'actualizar':
+            clave, cambios = argumentos
+            return self.arbol.actualizar(clave, cambios)
+        else:
+            raise ValueError(f"Operación desconocida en el WAL: {operacion}")
+
+    def _escribir(self, operacion, argumentos):
+        """Aplica la operación al árbol, la registra en el WAL si se aplicó, espera su durabilidad y devuelve su resultado"""
+        with self.cerrojo:
+            # El árbol valida antes de modificar nada: una operación rechazada no llega al WAL ni se reaplica al arrancar.
+            # Los lectores ya veían la escritura antes del fsync; quien escribe sigue recibiendo la respuesta después
+            resultado = self._aplicar(operacion, argumentos)
+            self.secuencia += 1
+            numero = self.registro.agregar(self.secuencia, operacion, argumentos)
+            self.pendientes += 1
+            if self.pendientes >= self.intervalo_checkpoint:
+                self._checkpoint()
+        # Fuera del cerrojo: las escrituras concurrentes comparten el mismo fsync
+        self.registro.confirmar(numero)
+        return resultado
+
+    def insertar(self, clave, datos):
+        """Inserta un proveedor de forma durable"""
+        self._escribir('insertar', (clave, datos))
+
+    def cargar_masivo(self, registros):
+        """Carga un lote de forma durable con una sola entrada en el WAL"""
+        self._escribir('cargar_masivo', list(registros))
+
+    def eliminar(self, clave):
+        """Elimina un proveedor de forma durable; devuelve sus datos o None si no existía"""
+        return self._escribir('eliminar', clave)
+
+    def actualizar(self, clave, cambios):
+        """Cambia campos de un proveedor de forma durable; devuelve los datos nuevos o None si no existía"""
+        return self._escribir('actualizar', (clave, cambios))
+
+    def checkpoint(self):
+        """Fuerza un punto de control"""
+        with self.cerrojo:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        """Guarda el estado completo (instantánea o páginas) y vacía el WAL"""
+        if self.arbol.almacenamiento:
+            self.arbol.sincronizar(secuencia=self.secuencia)
+        else:
+            guardar_instantanea(self.arbol, self.ruta_instantanea, self.secuencia)
+        self.registro.truncar()
+        self.secuencia_checkpoint = self.secuencia
+        self.pendientes = 0
+
+    def cerrar(self):
+        """Hace un último punto de control y cierra el WAL"""
+        with self.cerrojo:
+            if self.pendientes:
+                self._checkpoint()
+            self.registro.cerrar()
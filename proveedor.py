@@ -1,3 +1,6 @@
+import sys
+
+
 class Proveedor:
     """
     Clase que representa un proveedor de servicios en el sistema.
@@ -5,6 +8,9 @@ class Proveedor:
     métodos para convertir entre diferentes representaciones de datos.
     """
 
+    # Atributos fijos sin __dict__ por instancia - sin esto cada proveedor carga un diccionario propio
+    __slots__ = ('id', 'nombre', 'servicio', 'calificacion', 'ubicacion')
+
     def __init__(self, id_proveedor, nombre, servicio, calificacion, ubicacion):
         """
         Inicializa una nueva instancia de Proveedor con todos los datos requeridos
@@ -60,6 +66,47 @@ class Proveedor:
             datos['ubicacion']  # Extrae ubicación - sin esto no hay información geográfica
         )
 
+    @staticmethod
+    def empacar(datos):
+        """
+        Convierte el diccionario de un proveedor en el registro compacto que guarda el árbol B
+        La tupla (nombre, servicio, calificacion, ubicacion) omite el ID, que ya es la clave del nodo,
+        y comparte en memoria los textos repetidos de servicio y ubicación
+        Args:
+            datos (dict): Diccionario con los datos del proveedor
+        Returns:
+            tuple: Registro compacto del proveedor
+
+        Sin este método cada proveedor se guardaría como un diccionario completo,
+        lo que multiplica la memoria usada por registro en árboles grandes.
+        """
+        return (
+            datos['nombre'],  # Nombre del proveedor
+            sys.intern(datos['servicio']),  # Servicio internado - pocos valores distintos compartidos por muchos proveedores
+            datos['calificacion'],  # Calificación numérica
+            sys.intern(datos['ubicacion'])  # Ubicación internada - mismo motivo que el servicio
+        )
+
+    @staticmethod
+    def desempacar(id_proveedor, registro):
+        """
+        Reconstruye el diccionario de un proveedor desde su registro compacto
+        Se usa solo al entregar los datos fuera del árbol (API, instantáneas)
+        Args:
+            id_proveedor (int): ID del proveedor (clave en el árbol)
+            registro (tuple): Registro compacto generado por empacar
+        Returns:
+            dict: Representación en diccionario del proveedor
+        """
+        nombre, servicio, calificacion, ubicacion = registro
+        return {
+            'id': id_proveedor,
+            'nombre': nombre,
+            'servicio': servicio,
+            'calificacion': calificacion,
+            'ubicacion': ubicacion
+        }
+
     def __str__(self):
         """
         Representación en cadena legible para humanos del proveedor
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import app as aplicacion
+from arbol_b import ArbolB
+from cache_respuestas import CacheRespuestas
+
+
+def proveedor(clave, **cambios):
+    return dict({'id': clave, 'nombre': f'Proveedor {clave}', 'servicio': 'plomeria', 'calificacion': 4,
+                 'ubicacion': 'Zona 1'}, **cambios)
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    """Cliente de pruebas con un árbol y una caché de respuestas nuevos en cada prueba"""
+    monkeypatch.setattr(aplicacion, 'arbol_servicios', ArbolB(3))
+    monkeypatch.setattr(aplicacion, 'cache_respuestas', CacheRespuestas())
+    monkeypatch.setattr(aplicacion, 'persistencia', None)
+    return aplicacion.app.test_client()
+
+
+def ids(cliente):
+    return [datos['id'] for datos in cliente.get('/api/proveedores?limit=1000').get_json()['proveedores']]
+
+
+def test_carga_masiva_completa_o_nada(cliente):
+    respuesta = cliente.post('/api/proveedores/bulk', json=[proveedor(k) for k in range(1, 6)])
+    assert respuesta.status_code == 201
+    assert respuesta.get_json()['total_agregados'] == 5
+
+    respuesta = cliente.post('/api/proveedores/bulk', json=[proveedor(10), proveedor(3), proveedor(11, nombre=7)])
+    assert respuesta.status_code == 400
+    assert [error['indice'] for error in respuesta.get_json()['errores']] == [1, 2]
+    assert ids(cliente) == [1, 2, 3, 4, 5]
+
+
+def test_carga_masiva_ndjson(cliente):
+    cuerpo = '\n'.join(json.dumps(proveedor(k)) for k in (7, 8)) + '\n'
+    respuesta = cliente.post('/api/proveedores/bulk', data=cuerpo, content_type='application/x-ndjson')
+    assert respuesta.status_code == 201
+    assert ids(cliente) == [7, 8]
+
+
+@pytest.mark.parametrize('cambio', [{'nombre': 123}, {'nombre': '  '}, {'servicio': ['x']}, {'calificacion': True}])
+def test_alta_con_tipos_invalidos(cliente, cambio):
+    assert cliente.post('/api/proveedores', json=proveedor(1, **cambio)).status_code == 400
+    assert ids(cliente) == []
+
+
+def test_alta_duplicada(cliente):
+    assert cliente.post('/api/proveedores', json=proveedor(1)).status_code == 201
+    respuesta = cliente.post('/api/proveedores', json=proveedor(1, nombre='Otro'))
+    assert respuesta.status_code == 400
+    assert cliente.get('/api/buscar_id/1').get_json()['resultado']['nombre'] == 'Proveedor 1'
+
+
+def test_eliminar(cliente):
+    cliente.post('/api/proveedores/bulk', json=[proveedor(k) for k in range(1, 4)])
+    respuesta = cliente.delete('/api/proveedores/2')
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['proveedor'] == proveedor(2)
+    assert cliente.delete('/api/proveedores/2').status_code == 404
+    assert ids(cliente) == [1, 3]
+    assert cliente.get('/api/buscar/plomeria').get_json()['total_encontrados'] == 2
+
+
+def test_actualizar(cliente):
+    cliente.post('/api/proveedores', json=proveedor(1))
+    respuesta = cliente.patch('/api/proveedores/1', json={'calificacion': 2, 'servicio': 'pintura'})
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['proveedor'] == proveedor(1, calificacion=2, servicio='pintura')
+    assert cliente.get('/api/buscar/pintura').get_json()['total_encontrados'] == 1
+    assert cliente.get('/api/buscar/plomeria').get_json()['total_encontrados'] == 0
+
+
+@pytest.mark.parametrize('cambios, estado', [
+    ({'servicio': 5}, 400),
+    ({'nombre': ''}, 400),
+    ({'calificacion': 9}, 400),
+    ({'telefono': '1'}, 400),
+    ({'id': 2}, 400),
+    ({}, 400),
+])
+def test_actualizar_invalido_no_cambia_nada(cliente, cambios, estado):
+    cliente.post('/api/proveedores', json=proveedor(1))
+    assert cliente.patch('/api/proveedores/1', json=cambios).status_code == estado
+    assert cliente.get('/api/buscar_id/1').get_json()['resultado'] == proveedor(1)
+
+
+def test_actualizar_inexistente(cliente):
+    assert cliente.patch('/api/proveedores/9', json={'calificacion': 3}).status_code == 404
+
+
+def test_offset_sin_orden(cliente):
+    assert cliente.get('/api/proveedores?limit=2&offset=1').status_code == 400
@@ -0,0 +1,192 @@
+import random
+from collections import Counter
+from itertools import islice
+
+import pytest
+
+from almacenamiento import AlmacenamientoPaginado
+from arbol_b import ArbolB, ClaveDuplicada, ORDENES, RegistroDemasiadoGrande
+
+SERVICIOS = ('plomeria', 'pintura', 'electricidad')
+NOMBRES = ('Ana', 'Andrés', 'Angel', 'Pedro', 'María José', 'Hernández')
+
+
+def proveedor(clave, azar):
+    """Datos válidos de un proveedor con los cinco campos que guarda el árbol"""
+    return {'id': clave, 'nombre': f'{azar.choice(NOMBRES)} {clave % 7}', 'servicio': azar.choice(SERVICIOS),
+            'calificacion': azar.randint(1, 5), 'ubicacion': f'Zona {clave % 4}'}
+
+
+def revisar_nodos(arbol, nodo):
+    """Comprueba los conteos por hijo y el total de cada nodo; devuelve el total del subárbol"""
+    if nodo.es_hoja:
+        assert nodo.total == len(nodo.claves)
+        return nodo.total
+    assert len(nodo.hijos) == len(nodo.conteos) == len(nodo.claves) + 1
+    for i in range(len(nodo.hijos)):
+        assert nodo.conteos[i] == revisar_nodos(arbol, arbol._hijo(nodo, i))
+    assert nodo.total == len(nodo.claves) + sum(nodo.conteos)
+    return nodo.total
+
+
+def comprobar(arbol, modelo):
+    """El árbol, sus índices y contadores coinciden con el diccionario modelo"""
+    assert dict(arbol.rango()) == modelo
+    assert len(arbol) == len(modelo)
+    revisar_nodos(arbol, arbol.raiz)
+    for indice in arbol.indices.values():
+        for arbol_indice in indice.arboles():
+            revisar_nodos(arbol_indice, arbol_indice.raiz)
+    for orden in ORDENES:
+        assert arbol.obtener_todos_ordenados(orden) == sorted(modelo.values(), key=arbol.clave_orden(orden))
+    for campo in ('servicio', 'ubicacion'):
+        conteos = Counter(datos[campo] for datos in modelo.values())
+        for valor in set(conteos) | {'ninguno'}:
+            assert arbol.contar_por(campo, valor) == conteos[valor]
+            assert [datos['id'] for datos in arbol.iterar_por(campo, valor)] == \
+                sorted(clave for clave, datos in modelo.items() if datos[campo] == valor)
+    claves = sorted(modelo)
+    for posicion in (0, len(claves) // 2, len(claves)):
+        assert [clave for clave, _ in islice(arbol.recorrer_desde_posicion(posicion), 3)] == \
+            claves[posicion:posicion + 3]
+
+
+def aplicar_al_azar(arbol, modelo, azar, pasos):
+    """Inserciones, bajas, cambios y cargas masivas al azar, sobre el árbol y el modelo a la vez"""
+    for _ in range(pasos):
+        operacion = azar.random()
+        clave = azar.randrange(600)
+        if operacion < 0.4:
+            datos = proveedor(clave, azar)
+            if clave in modelo:
+                with pytest.raises(ClaveDuplicada):
+                    arbol.insertar(clave, datos)
+            else:
+                arbol.insertar(clave, datos)
+                modelo[clave] = datos
+        elif operacion < 0.65:
+            assert arbol.eliminar(clave) == modelo.pop(clave, None)
+        elif operacion < 0.9:
+            cambios = azar.choice([{'calificacion': azar.randint(1, 5)}, {'nombre': azar.choice(NOMBRES)},
+                                   {'servicio': azar.choice(SERVICIOS), 'ubicacion': 'Zona 9'}])
+            esperado = dict(modelo[clave], **cambios) if clave in modelo else None
+            assert arbol.actualizar(clave, cambios) == esperado
+            if esperado is not None:
+                modelo[clave] = esperado
+        else:
+            # Lotes pequeños (inserciones sueltas) y grandes (reconstrucción); algunos con un ID que ya existe
+            nuevas = [k for k in azar.sample(range(600, 5000), azar.choice([3, 200])) if k not in modelo]
+            lote = [(k, proveedor(k, azar)) for k in nuevas]
+            if modelo and azar.random() < 0.3:
+                existente = azar.choice(sorted(modelo))
+                with pytest.raises(ClaveDuplicada):
+                    arbol.cargar_masivo(lote + [(existente, proveedor(existente, azar))])
+            else:
+                arbol.cargar_masivo(lote)
+                modelo.update(lote)
+
+
+@pytest.mark.parametrize('grado', [2, 3, 5])
+def test_operaciones_al_azar_en_memoria(grado):
+    azar = random.Random(grado)
+    arbol = ArbolB(grado)
+    modelo = {}
+    for _ in range(8):
+        aplicar_al_azar(arbol, modelo, azar, 150)
+        comprobar(arbol, modelo)
+
+
+@pytest.mark.parametrize('grado', [2, 4])
+def test_operaciones_al_azar_paginado_y_reabierto(tmp_path, grado):
+    ruta = str(tmp_path / 'arbol.db')
+    azar = random.Random(grado)
+    modelo = {}
+    almacenamiento = AlmacenamientoPaginado(ruta, tamano_pagina=4096, paginas_en_cache=16)
+    arbol = ArbolB(grado, almacenamiento=almacenamiento)
+    for _ in range(5):
+        aplicar_al_azar(arbol, modelo, azar, 150)
+        comprobar(arbol, modelo)
+        arbol.sincronizar()
+        almacenamiento.cerrar()
+        almacenamiento = AlmacenamientoPaginado(ruta, paginas_en_cache=16)
+        arbol = ArbolB(grado, almacenamiento=almacenamiento)
+        comprobar(arbol, modelo)
+    almacenamiento.cerrar()
+
+
+def test_instantanea_no_cambia_con_las_escrituras(tmp_path):
+    almacenamiento = AlmacenamientoPaginado(str(tmp_path / 'arbol.db'), tamano_pagina=4096)
+    arbol = ArbolB(3, almacenamiento=almacenamiento)
+    azar = random.Random(1)
+    modelo = {}
+    aplicar_al_azar(arbol, modelo, azar, 200)
+    arbol.sincronizar()
+    instantanea, anterior = arbol.instantanea(), dict(modelo)
+    aplicar_al_azar(arbol, modelo, azar, 300)
+    arbol.sincronizar()
+    assert dict(instantanea.rango()) == anterior
+    comprobar(arbol, modelo)
+    almacenamiento.cerrar()
+
+
+def paginas_tras_escrituras(ruta, retener):
+    """Páginas del archivo después de 500 inserciones sincronizadas, reteniendo o no una instantánea del inicio"""
+    almacenamiento = AlmacenamientoPaginado(ruta, tamano_pagina=16384)
+    arbol = ArbolB(32, almacenamiento=almacenamiento)
+    azar = random.Random(2)
+    arbol.cargar_masivo([(k, proveedor(k, azar)) for k in range(500)])
+    arbol.sincronizar()
+    instantanea = arbol.instantanea() if retener else None
+    for clave in range(500, 1000):
+        arbol.insertar(clave, proveedor(clave, azar))
+        arbol.sincronizar()
+    if retener:
+        assert [clave for clave, _ in instantanea.rango()] == list(range(500))
+    paginas = almacenamiento.paginas_usadas
+    almacenamiento.cerrar()
+    return paginas
+
+
+def test_instantanea_vieja_no_retiene_paginas_nuevas(tmp_path):
+    # Solo quedan retenidas las páginas que la instantánea vio; las reservadas después se reciclan enseguida
+    sin_instantanea = paginas_tras_escrituras(str(tmp_path / 'a.db'), retener=False)
+    assert paginas_tras_escrituras(str(tmp_path / 'b.db'), retener=True) < 2 * sin_instantanea
+
+
+@pytest.mark.parametrize('cambio', [{'nombre': 123}, {'servicio': None}, {'ubicacion': ['x']}])
+def test_tipos_invalidos_no_modifican_nada(cambio):
+    azar = random.Random(3)
+    arbol = ArbolB(2)
+    modelo = {k: proveedor(k, azar) for k in range(50)}
+    arbol.cargar_masivo(modelo.items())
+    with pytest.raises(TypeError):
+        arbol.insertar(100, dict(proveedor(100, azar), **cambio))
+    with pytest.raises(TypeError):
+        arbol.cargar_masivo([(k, proveedor(k, azar)) for k in range(100, 110)] +
+                            [(110, dict(proveedor(110, azar), **cambio))])
+    with pytest.raises(TypeError):
+        arbol.actualizar(7, cambio)
+    comprobar(arbol, modelo)
+
+
+def test_registro_demasiado_grande_no_modifica_nada(tmp_path):
+    almacenamiento = AlmacenamientoPaginado(str(tmp_path / 'arbol.db'), tamano_pagina=4096)
+    arbol = ArbolB(8, almacenamiento=almacenamiento)
+    azar = random.Random(4)
+    modelo = {k: proveedor(k, azar) for k in range(20)}
+    arbol.cargar_masivo(modelo.items())
+    grande = dict(proveedor(30, azar), nombre='x' * 5000)
+    with pytest.raises(RegistroDemasiadoGrande):
+        arbol.insertar(30, grande)
+    with pytest.raises(RegistroDemasiadoGrande):
+        arbol.actualizar(3, {'nombre': 'x' * 5000})
+    comprobar(arbol, modelo)
+    almacenamiento.cerrar()
+
+
+def test_buscar_nombre_ordena_por_puntaje_antes_de_cortar():
+    arbol = ArbolB(3)
+    for clave, nombre in enumerate(['Ana', 'Anabelle', 'Anastasia', 'Andres', 'Angel'], start=1):
+        arbol.insertar(clave, {'id': clave, 'nombre': nombre, 'servicio': 's', 'calificacion': 4, 'ubicacion': 'u'})
+    resultados = arbol.buscar_nombre('an', limite=2)
+    assert [(r['proveedor']['nombre'], r['puntaje']) for r in resultados] == [('Ana', 0.667), ('Angel', 0.4)]
@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+from arbol_b import ArbolB, ClaveDuplicada
+from particionado import ArbolParticionado
+
+
+def proveedor(clave, nombre):
+    return {'id': clave, 'nombre': nombre, 'servicio': 'plomeria', 'calificacion': 4, 'ubicacion': 'Zona 1'}
+
+
+@pytest.fixture
+def particionado():
+    arbol = ArbolParticionado(3, grado=3)
+    yield arbol
+    arbol.cerrar()
+
+
+def test_carga_masiva_rechazada_no_carga_en_ninguna_particion(particionado):
+    particionado.cargar_masivo([(k, proveedor(k, f'P {k}')) for k in range(0, 30, 2)])
+    nuevos = [(k, proveedor(k, f'P {k}')) for k in range(1, 30, 2)]
+    with pytest.raises(ClaveDuplicada):
+        particionado.cargar_masivo(nuevos + [(4, proveedor(4, 'Repetido'))])
+    with pytest.raises(TypeError):
+        particionado.cargar_masivo(nuevos + [(31, proveedor(31, 5))])
+    assert [clave for clave, _ in particionado.rango()] == list(range(0, 30, 2))
+    particionado.cargar_masivo(nuevos)
+    assert len(particionado) == 30
+
+
+def test_buscar_nombre_igual_que_un_solo_arbol(particionado):
+    azar = random.Random(5)
+    silabas = ['an', 'ge', 'la', 'mar', 'to', 'ri', 'sa', 'el', 'pe', 'dro']
+    registros = [(k, proveedor(k, ' '.join(''.join(azar.choice(silabas) for _ in range(azar.randint(1, 3)))
+                                           for _ in range(azar.randint(1, 2)))))
+                 for k in range(400)]
+    arbol = ArbolB(3)
+    arbol.cargar_masivo(registros)
+    particionado.cargar_masivo(registros)
+    for _ in range(60):
+        texto = ' '.join(azar.choice(silabas + ['amr', 'pdro'])[:azar.randint(1, 4)] for _ in range(azar.randint(1, 2)))
+        limite = azar.randint(1, 12)
+        assert particionado.buscar_nombre(texto, limite) == arbol.buscar_nombre(texto, limite)
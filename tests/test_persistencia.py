@@ -0,0 +1,48 @@
+import os
+import time
+
+import pytest
+
+import persistencia
+from arbol_b import ArbolB, ClaveDuplicada
+from persistencia import GestorPersistencia, RegistroEscritura
+
+
+def proveedor(clave, nombre='Proveedor'):
+    return {'id': clave, 'nombre': f'{nombre} {clave}', 'servicio': 'plomeria', 'calificacion': 4, 'ubicacion': 'Zona 1'}
+
+
+def test_reinicio_reaplica_el_wal(tmp_path):
+    gestor = GestorPersistencia(ArbolB(3), str(tmp_path), intervalo_checkpoint=7)
+    gestor.cargar_masivo([(k, proveedor(k)) for k in range(20)])
+    for clave in range(20, 40):
+        gestor.insertar(clave, proveedor(clave))
+    gestor.eliminar(5)
+    gestor.actualizar(6, {'calificacion': 1})
+    with pytest.raises(ClaveDuplicada):
+        gestor.cargar_masivo([(100, proveedor(100)), (7, proveedor(7))])
+    esperado = dict(gestor.arbol.rango())
+    gestor.registro.cerrar()  # Sin punto de control final: el arranque reaplica la cola del WAL
+
+    reabierto = GestorPersistencia(ArbolB(3), str(tmp_path))
+    assert dict(reabierto.arbol.rango()) == esperado
+    assert reabierto.omitidas == []
+    reabierto.cerrar()
+
+
+def test_lote_hace_fsync_al_vencer_el_intervalo(tmp_path, monkeypatch):
+    sincronizados = []
+    fsync = os.fsync
+    monkeypatch.setattr(persistencia.os, 'fsync', lambda fd: (sincronizados.append(fd), fsync(fd)))
+    registro = RegistroEscritura(str(tmp_path / 'registro.wal'), 'lote', intervalo_fsync=0.05)
+    registro.confirmar(registro.agregar(1, 'insertar', (1, proveedor(1))))
+    assert registro.confirmadas < registro.escritas  # Dentro del intervalo: solo se escribió
+
+    # Sin otra escritura, el hilo del registro la baja a disco al vencer el intervalo
+    limite = time.monotonic() + 2
+    while registro.confirmadas < registro.escritas and time.monotonic() < limite:
+        time.sleep(0.01)
+    assert registro.confirmadas == registro.escritas
+    assert sincronizados
+    registro.cerrar()
+    assert not registro.sincronizador.is_alive()